@@ -1,13 +1,15 @@
+import time
+# Taken before any other import so the first run of a process includes import cost
+SCRIPT_START = time.perf_counter()
+
 import streamlit as st
-from emotion_detector import EmotionDetector
+from emotion_detector import EmotionDetector, get_model_registry, get_frame_cache, annotate_frame
 from spotify_recommender import SpotifyRecommender
+from image_io import decode_image
 from collections import Counter
 import os
 import tempfile
 import logging
-import time
-import cv2
-import numpy as np
 
 # Setup logging
 logging.basicConfig(filename="app_errors.log", level=logging.INFO)
@@ -31,11 +33,35 @@ if 'save_results' not in st.session_state:
     st.session_state.save_results = False
 if 'video_processor' not in st.session_state:
     st.session_state.video_processor = None
+if 'processed_images' not in st.session_state:
+    st.session_state.processed_images = {}
+if 'video_uploads' not in st.session_state:
+    st.session_state.video_uploads = {}
+
+# Uploads are written to disk in slices of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Uploaded videos live in this directory; files untouched for UPLOAD_MAX_AGE seconds belong to ended sessions
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'mood_music_uploads'))
+UPLOAD_MAX_AGE = int(os.getenv('UPLOAD_MAX_AGE', 6 * 3600))
+# How often the live tab checks the stream for a new emotion
+LIVE_POLL_INTERVAL = 1.0
+
+def load_model_registry():
+    """Return the shared model registry, warming its models up in the background while the UI renders"""
+    registry = get_model_registry()
+    registry.start_warm_up()
+    return registry
+
+@st.cache_resource
+def start_playlist_index_refresh(_recommender):
+    """Start the background playlist index refresh once per process"""
+    _recommender.start_index_refresh()
+    return True
 
 def initialize_services():
     """Initialize emotion detector and Spotify recommender"""
     if st.session_state.emotion_detector is None:
-        st.session_state.emotion_detector = EmotionDetector()
+        st.session_state.emotion_detector = EmotionDetector(registry=load_model_registry())
     
     if st.session_state.spotify_recommender is None:
         client_id = os.getenv('SPOTIFY_CLIENT_ID') or st.secrets.get("SPOTIFY_CLIENT_ID")
@@ -44,6 +70,25 @@ def initialize_services():
             st.error("Spotify credentials not found. Please set SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET.")
             st.stop()
         st.session_state.spotify_recommender = SpotifyRecommender(client_id, client_secret)
+        start_playlist_index_refresh(st.session_state.spotify_recommender)
+
+def display_songs(songs):
+    """Render a list of songs with artwork, links and previews"""
+    for song in songs:
+        with st.container():
+            cols = st.columns([1, 3])
+            with cols[0]:
+                if song['image_url']:
+                    st.image(song['image_url'], width=100)
+            with cols[1]:
+                st.write(f"**{song['name']}**")
+                st.write(f"By: {song['artist']}")
+                if song.get('emotion'):
+                    st.write(f"Mood: {song['emotion'].capitalize()}")
+                st.write(f"[Listen on Spotify]({song['url']})")
+                if song['preview_url']:
+                    st.audio(song['preview_url'])
+            st.markdown("---")
 
 def display_recommendations(emotion, language):
     """Display music recommendations based on emotion"""
@@ -53,41 +98,53 @@ def display_recommendations(emotion, language):
     recommendations = st.session_state.spotify_recommender.get_recommendations(emotion, language)
     if recommendations:
         st.write(f"🎵 **Recommended {language.capitalize()} Songs for {emotion.capitalize()} Mood:**")
-        for song in recommendations:
-            with st.container():
-                cols = st.columns([1, 3])
-                with cols[0]:
-                    if song['image_url']:
-                        st.image(song['image_url'], width=100)
-                with cols[1]:
-                    st.write(f"**{song['name']}**")
-                    st.write(f"By: {song['artist']}")
-                    st.write(f"[Listen on Spotify]({song['url']})")
-                    if song['preview_url']:
-                        st.audio(song['preview_url'])
-                st.markdown("---")
+        display_songs(recommendations)
     else:
         st.warning(f"No {language} songs found for {emotion} mood. Try a different language or emotion.")
 
+def display_blended_recommendations(emotion_history, language):
+    """Display one playlist mixing moods in proportion to a detected emotion distribution"""
+    emotion_counts = Counter(emotion_history)
+    if len(emotion_counts) < 2 or not st.session_state.spotify_recommender:
+        return
+
+    total = sum(emotion_counts.values())
+    mix = ", ".join(f"{count / total:.0%} {emotion}" for emotion, count in emotion_counts.most_common())
+    st.write(f"🎶 **Blended {language.capitalize()} Playlist ({mix}):**")
+    songs = st.session_state.spotify_recommender.get_blended_recommendations(emotion_counts, [language], limit=10)
+    if songs:
+        display_songs(songs)
+    else:
+        st.warning("Could not build a blended playlist for this emotion mix.")
+
+def analyze_image_bytes(image_bytes, source):
+    """Analyze encoded image bytes, reusing cached results and recording each image once per session"""
+    detector = st.session_state.emotion_detector
+    cache = get_frame_cache()
+    key = cache.make_key(image_bytes, detector.detector_backend, detector.face_detector_backend,
+                         detector.emotion_backend)
+    cached = cache.get(key)
+    if cached is None:
+        frame = decode_image(image_bytes)
+        face_records, _ = detector.analyze_frame(frame, return_rgb=False)
+        cached = (face_records, annotate_frame(frame, face_records, from_bgr=True))
+        cache.put(key, *cached)
+    face_records, annotated_frame = cached
+
+    frame_emotions = [face['emotion'] for face in face_records]
+    if st.session_state.processed_images.get(source) != key:
+        st.session_state.processed_images[source] = key
+        detector.record_detections([dict(face, timestamp=time.time()) for face in face_records])
+        detector.frame_count += 1
+    return frame_emotions, annotated_frame
+
 def process_camera_snapshot():
     """Process webcam snapshot for emotion detection"""
     camera_image = st.camera_input("Take a Snapshot", key="camera_snapshot")
     if camera_image is not None:
         try:
-            file_bytes = np.asarray(bytearray(camera_image.getvalue()), dtype=np.uint8)
-            frame = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-            frame_emotions, rgb_frame = st.session_state.emotion_detector.process_frame(frame, is_image=True)
-            st.session_state.emotion_detector.emotion_history.extend(frame_emotions)
-            st.session_state.emotion_detector.frame_count += 1
-            
-            for face_data in st.session_state.emotion_detector.detected_faces[-5:]:
-                if time.time() - face_data['timestamp'] < 5:
-                    x, y, w, h = face_data['box']
-                    cv2.rectangle(rgb_frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                    cv2.putText(rgb_frame, f"{face_data['emotion']}: {face_data['confidence']:.1f}%", 
-                                (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-            
-            st.image(rgb_frame, channels="RGB", caption="Captured Snapshot")
+            frame_emotions, annotated_frame = analyze_image_bytes(camera_image.getvalue(), "snapshot")
+            st.image(annotated_frame, channels="RGB", caption="Captured Snapshot")
             if frame_emotions:
                 st.session_state.current_emotion = Counter(frame_emotions).most_common(1)[0][0]
         except Exception as e:
@@ -99,34 +156,66 @@ def process_uploaded_image():
     uploaded_file = st.file_uploader("Upload an image", type=['jpg', 'jpeg', 'png'])
     if uploaded_file is not None:
         try:
-            file_bytes = np.asarray(bytearray(uploaded_file.read()), dtype=np.uint8)
-            frame = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-            frame_emotions, rgb_frame = st.session_state.emotion_detector.process_frame(frame, is_image=True)
-            st.session_state.emotion_detector.emotion_history.extend(frame_emotions)
-            st.session_state.emotion_detector.frame_count += 1
-            
-            for face_data in st.session_state.emotion_detector.detected_faces[-5:]:
-                if time.time() - face_data['timestamp'] < 5:
-                    x, y, w, h = face_data['box']
-                    cv2.rectangle(rgb_frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                    cv2.putText(rgb_frame, f"{face_data['emotion']}: {face_data['confidence']:.1f}%", 
-                                (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-            
-            st.image(rgb_frame, channels="RGB", caption="Uploaded Image")
+            frame_emotions, annotated_frame = analyze_image_bytes(uploaded_file.getvalue(), "upload")
+            st.image(annotated_frame, channels="RGB", caption="Uploaded Image")
             if frame_emotions:
                 st.session_state.current_emotion = Counter(frame_emotions).most_common(1)[0][0]
         except Exception as e:
             logging.error(f"Image processing error: {str(e)}")
             st.error(f"Error processing image: {str(e)}")
 
+def clear_video_uploads():
+    """Delete temp files written for earlier video uploads in this session"""
+    for path in st.session_state.video_uploads.values():
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    st.session_state.video_uploads = {}
+
+def sweep_stale_uploads(max_age=UPLOAD_MAX_AGE):
+    """Delete upload temp files not used for max_age seconds, left behind by sessions that ended"""
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(UPLOAD_DIR))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+        except OSError:
+            pass
+
+def get_uploaded_video_path(uploaded_file):
+    """Write an uploaded video to a temp file once per upload and reuse it across reruns"""
+    # file_id identifies an upload without touching its bytes, so reruns cost nothing
+    upload_key = getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size)
+    video_path = st.session_state.video_uploads.get(upload_key)
+    if video_path and os.path.exists(video_path):
+        # Mark the file as in use so the stale-upload sweep leaves it alone
+        os.utime(video_path)
+        return video_path
+
+    clear_video_uploads()
+    sweep_stale_uploads()
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    suffix = os.path.splitext(uploaded_file.name)[1] or '.mp4'
+    # getvalue() hands back the upload's own bytes object, so writing it out does not copy it
+    view = memoryview(uploaded_file.getvalue())
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=UPLOAD_DIR) as tmp_file:
+        for start in range(0, len(view), UPLOAD_CHUNK_SIZE):
+            tmp_file.write(view[start:start + UPLOAD_CHUNK_SIZE])
+        video_path = tmp_file.name
+    st.session_state.video_uploads[upload_key] = video_path
+    return video_path
+
 def process_uploaded_video():
     """Process uploaded video file for emotion detection and display dominant emotion"""
     uploaded_file = st.file_uploader("Upload a video file", type=['mp4', 'avi', 'mov'])
     if uploaded_file is not None:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
-            tmp_file.write(uploaded_file.read())
-            video_path = tmp_file.name
-        
+        video_path = get_uploaded_video_path(uploaded_file)
+
         st.video(uploaded_file)
         col1, col2 = st.columns(2)
         with col1:
@@ -137,11 +226,13 @@ def process_uploaded_video():
         if st.button("Process Video"):
             with st.spinner("Processing video..."):
                 try:
-                    video_processor = EmotionDetector()
+                    video_processor = EmotionDetector(registry=load_model_registry())
                     emotions = video_processor.process_video(
                         video_path,
                         duration_seconds=duration,
-                        max_frames=max_frames
+                        max_frames=max_frames,
+                        pipelined=True,
+                        track_faces=True
                     )
                     if emotions:
                         emotion_counts = Counter(emotions)
@@ -156,17 +247,66 @@ def process_uploaded_video():
                 except Exception as e:
                     logging.error(f"Video processing error: {str(e)}")
                     st.error(f"Error processing video: {str(e)}")
-                finally:
-                    try:
-                        os.unlink(video_path)
-                    except:
-                        pass
+
+def process_live_stream(language):
+    """Run live webcam emotion detection and refresh recommendations as the emotion changes"""
+    from streamlit_webrtc import webrtc_streamer, WebRtcMode
+    from live_stream import EmotionVideoProcessor, RTC_CONFIGURATION
+
+    ctx = webrtc_streamer(
+        key="live-emotion",
+        mode=WebRtcMode.SENDRECV,
+        rtc_configuration=RTC_CONFIGURATION,
+        video_processor_factory=EmotionVideoProcessor,
+        media_stream_constraints={"video": True, "audio": False},
+        async_processing=True
+    )
+    # Polling blocks this script run, so only do it while the user is watching the live tab
+    auto_refresh = st.toggle("Keep recommendations in sync with the stream", key="live_auto_refresh")
+    status_placeholder = st.empty()
+    emotion_placeholder = st.empty()
+    recommendations_placeholder = st.empty()
+
+    def show_emotion(emotion):
+        st.session_state.current_emotion = emotion
+        emotion_placeholder.markdown(f"### Live Emotion: **{emotion.capitalize()}**")
+        with recommendations_placeholder.container():
+            display_recommendations(emotion, language)
+
+    if not (ctx.state.playing and ctx.video_processor):
+        return
+    if not auto_refresh:
+        emotion = ctx.video_processor.current_emotion
+        if emotion:
+            show_emotion(emotion)
+        st.button("Refresh recommendations", key="live_refresh")
+        return
+
+    last_emotion = None
+    while ctx.state.playing and ctx.video_processor:
+        processor = ctx.video_processor
+        emotion = processor.current_emotion
+        if emotion and emotion != last_emotion:
+            last_emotion = emotion
+            show_emotion(emotion)
+        # Touch the page on every poll: Streamlit only acts on rerun and stop requests (including
+        # the webrtc Stop button) when the script calls into st, so a silent sleep loop would hang
+        status_placeholder.caption(
+            f"Live · checked {time.strftime('%H:%M:%S')} · analysis every {processor.interval:.1f}s "
+            f"· latency {processor.latency:.2f}s"
+        )
+        time.sleep(LIVE_POLL_INTERVAL)
 
 def main():
     st.write("**Note**: Ensure you have installed `streamlit`, `opencv-python`, `deepface`, `mtcnn`, `pandas`, `seaborn`, `matplotlib`, `spotipy`, and `python-dotenv`.")
     initialize_services()
     
     st.title("Mood-Based Music Recommendation System 🎵")
+    if 'first_paint_ms' not in st.session_state:
+        st.session_state.first_paint_ms = (time.perf_counter() - SCRIPT_START) * 1000
+        logging.info(f"Time to first paint: {st.session_state.first_paint_ms:.0f} ms")
+        # Once per session, so leftovers are cleared even if nobody uploads again
+        sweep_stale_uploads()
     st.write("This app detects your emotions from snapshots, images, or videos and recommends music based on your mood!")
     
     st.sidebar.title("Settings")
@@ -181,6 +321,8 @@ def main():
         st.session_state.video_processor = None
         st.session_state.current_emotion = None
         st.session_state.save_results = False
+        st.session_state.processed_images = {}
+        clear_video_uploads()
         st.rerun()
     
     # Display Current Emotion in the sidebar
@@ -194,12 +336,26 @@ def main():
             st.sidebar.write(f"Confidence: {st.session_state.video_processor.detected_faces[-1]['confidence']:.1f}%")
     else:
         st.sidebar.write("No emotion detected yet.")
+
+    st.sidebar.markdown("---")
+    registry = get_model_registry()
+    model_status = f"ready ({registry.warm_up_seconds:.1f}s warm-up)" if registry.is_warm else "loading in background"
+    st.sidebar.caption(f"Time to first paint: {st.session_state.first_paint_ms:.0f} ms · Models: {model_status}")
+    detector = st.session_state.emotion_detector
+    if detector and detector.use_inference_server:
+        stats = registry.get_inference_server(detector.emotion_backend).stats()
+        if 'faces_per_second' in stats:
+            st.sidebar.caption(
+                f"Inference server: {stats['faces_per_second']:.0f} faces/s · batch {stats['mean_batch_size']:.1f} · "
+                f"queue p50 {stats['queue_p50_ms']:.1f} ms / p99 {stats['queue_p99_ms']:.1f} ms"
+            )
     
-    tab1, tab2, tab3, tab4 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5 = st.tabs([
         "Snapshot Detection", 
         "Image/Video Analysis",
         "Music Recommendations", 
-        "Analytics"
+        "Analytics",
+        "Live Detection"
     ])
     
     with tab1:
@@ -219,6 +375,8 @@ def main():
         st.subheader("Music Recommendations")
         if st.session_state.current_emotion:
             display_recommendations(st.session_state.current_emotion, language)
+            if st.session_state.video_processor:
+                display_blended_recommendations(st.session_state.video_processor.emotion_history, language)
         else:
             st.info("Take a snapshot, upload an image, or process a video to get music recommendations!")
     
@@ -231,5 +389,11 @@ def main():
         else:
             st.info("Take a snapshot, upload an image, or process a video to see emotion analytics!")
 
+    # Rendered last because it keeps polling the stream while the camera is on
+    with tab5:
+        st.subheader("Live Emotion Detection")
+        st.write("Start your camera to detect emotions continuously and update recommendations on the fly.")
+        process_live_stream(language)
+
 if __name__ == "__main__":
     main()
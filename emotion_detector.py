@@ -1,42 +1,286 @@
 import streamlit as st
 import cv2
 import numpy as np
-from deepface import DeepFace
-from mtcnn import MTCNN
-from collections import Counter
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
+from video_sampler import FrameSampler
+from video_pipeline import VideoPipeline
+from video_parallel import analyze_video_segments
+from face_tracker import FaceTracker
+from face_detectors import DEFAULT_FACE_DETECTOR, create_face_detector
+from emotion_inference import DEFAULT_EMOTION_BACKEND, create_emotion_model
+from inference_server import InferenceServer, USE_INFERENCE_SERVER
+from ring_buffer import EmotionHistory, FaceBuffer, EMOTION_LABELS
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
 import time
 import os
 import logging
+import threading
+import hashlib
 
 # Setup logging
 logging.basicConfig(filename="emotion_errors.log", level=logging.INFO)
 
-class EmotionDetector:
+# deepface (TensorFlow), the face detector backends, pandas, seaborn and matplotlib are imported inside the
+# functions that use them so importing this module stays fast
+
+# Input geometry DeepFace uses for the emotion model
+FACE_TARGET_SIZE = (224, 224)
+EMOTION_INPUT_SIZE = (48, 48)
+# Timeline bucket width when timestamps are seconds into a video rather than wall-clock time
+VIDEO_BUCKET_SECONDS = 1
+# Face detection runs on a copy of the frame shrunk to this longest side; 0 detects at full resolution
+DETECTION_MAX_SIDE = int(os.getenv('DETECTION_MAX_SIDE', 960))
+# Upper bound on the annotated frames and face crops held by the shared result cache
+FRAME_CACHE_MAX_BYTES = int(os.getenv('FRAME_CACHE_MAX_BYTES', 64 * 2 ** 20))
+
+def preprocess_face(face_img):
+    """Prepare a face crop the way DeepFace 0.0.79's analyze(detector_backend='skip') does before the
+    emotion model; `python emotion_inference.py deepface-parity` measures how closely the two agree"""
+    factor = min(FACE_TARGET_SIZE[0] / face_img.shape[0], FACE_TARGET_SIZE[1] / face_img.shape[1])
+    dsize = (int(face_img.shape[1] * factor), int(face_img.shape[0] * factor))
+    face_img = cv2.resize(face_img, dsize)
+    diff_0 = FACE_TARGET_SIZE[0] - face_img.shape[0]
+    diff_1 = FACE_TARGET_SIZE[1] - face_img.shape[1]
+    face_img = np.pad(
+        face_img,
+        ((diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)),
+        "constant"
+    )
+    if face_img.shape[0:2] != FACE_TARGET_SIZE:
+        face_img = cv2.resize(face_img, FACE_TARGET_SIZE)
+    face_img = face_img.astype(np.float32) / 255
+    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, EMOTION_INPUT_SIZE)
+
+class ModelRegistry:
+    """Process-wide holder for the face detectors and emotion models, each loaded once and shared"""
+
     def __init__(self):
-        self.detector = MTCNN()
-        self.emotions = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
-        self.emotion_history = []
-        self.detected_faces = []
+        self._lock = threading.Lock()
+        self._face_detectors = {}
+        self._idle_face_detectors = defaultdict(list)
+        self._emotion_models = {}
+        self._inference_servers = {}
+        self._warm_up_thread = None
+        self.warm_up_seconds = None
+
+    def get_face_detector(self, backend=None):
+        """Return the shared detector for a face detector backend, loading it on first use"""
+        backend = backend or DEFAULT_FACE_DETECTOR
+        face_detector = self._face_detectors.get(backend)
+        if face_detector is None:
+            with self._lock:
+                face_detector = self._face_detectors.get(backend)
+                if face_detector is None:
+                    face_detector = create_face_detector(backend)
+                    self._face_detectors[backend] = face_detector
+        return face_detector
+
+    @contextmanager
+    def lease_face_detector(self, backend=None):
+        """Borrow a face detector instance no other thread is using, creating one if all are busy.
+
+        The shared detector from get_face_detector serializes its callers behind a lock, so threads
+        that should detect in parallel (the video pipeline's detection workers) lease their own.
+        """
+        backend = backend or DEFAULT_FACE_DETECTOR
+        with self._lock:
+            idle = self._idle_face_detectors[backend]
+            face_detector = idle.pop() if idle else None
+        if face_detector is None:
+            face_detector = create_face_detector(backend)
+        try:
+            yield face_detector
+        finally:
+            with self._lock:
+                self._idle_face_detectors[backend].append(face_detector)
+
+    def get_emotion_model(self, backend=None):
+        """Return the shared emotion model for an inference backend, loading it on first use"""
+        backend = backend or DEFAULT_EMOTION_BACKEND
+        emotion_model = self._emotion_models.get(backend)
+        if emotion_model is None:
+            with self._lock:
+                emotion_model = self._emotion_models.get(backend)
+                if emotion_model is None:
+                    emotion_model = create_emotion_model(backend)
+                    self._emotion_models[backend] = emotion_model
+        return emotion_model
+
+    def get_inference_server(self, backend=None):
+        """Return the shared micro-batching server in front of a backend's emotion model"""
+        backend = backend or DEFAULT_EMOTION_BACKEND
+        with self._lock:
+            server = self._inference_servers.get(backend)
+            if server is None:
+                server = InferenceServer(lambda: self.get_emotion_model(backend))
+                self._inference_servers[backend] = server
+        return server
+
+    def warm_up(self):
+        """Load both models and push a dummy input through each so the first real request is fast"""
+        start = time.perf_counter()
+        try:
+            self.get_face_detector().detect_faces(np.zeros((160, 160, 3), dtype=np.uint8))
+            self.get_emotion_model().predict(
+                np.zeros((1,) + EMOTION_INPUT_SIZE + (1,), dtype=np.float32), verbose=0
+            )
+            self.warm_up_seconds = time.perf_counter() - start
+            logging.info(f"Model warm-up finished in {self.warm_up_seconds:.2f}s")
+        except Exception as e:
+            logging.error(f"Model warm-up error: {str(e)}")
+
+    def start_warm_up(self):
+        """Warm the models up on a background thread, once per process"""
+        with self._lock:
+            if self._warm_up_thread is not None:
+                return self._warm_up_thread
+            self._warm_up_thread = threading.Thread(target=self.warm_up, name="model-warm-up", daemon=True)
+        self._warm_up_thread.start()
+        return self._warm_up_thread
+
+    @property
+    def is_warm(self):
+        return self.warm_up_seconds is not None
+
+_model_registry = ModelRegistry()
+
+def get_model_registry():
+    """Return the process-wide model registry"""
+    return _model_registry
+
+def annotate_frame(rgb_frame, face_records, from_bgr=False):
+    """Draw boxes and emotion labels for the given faces onto a copy of the frame.
+
+    With from_bgr the frame is BGR and the colour conversion to RGB doubles as the copy.
+    """
+    annotated = cv2.cvtColor(rgb_frame, cv2.COLOR_BGR2RGB) if from_bgr else rgb_frame.copy()
+    for face_data in face_records:
+        x, y, w, h = face_data['box']
+        cv2.rectangle(annotated, (x, y), (x+w, y+h), (0, 255, 0), 2)
+        cv2.putText(annotated, f"{face_data['emotion']}: {face_data['confidence']:.1f}%",
+                    (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+    return annotated
+
+class FrameResultCache:
+    """Thread-safe LRU cache of analyzed images keyed by a hash of their encoded bytes, bounded by count and size"""
+
+    def __init__(self, max_entries=32, max_bytes=FRAME_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(image_bytes, detector_backend='skip', face_detector_backend=None, emotion_backend=None):
+        return (hashlib.sha256(image_bytes).hexdigest(), detector_backend,
+                face_detector_backend or DEFAULT_FACE_DETECTOR, emotion_backend or DEFAULT_EMOTION_BACKEND)
+
+    @staticmethod
+    def entry_bytes(face_records, annotated_frame):
+        """Pixel bytes held by one entry: the annotated frame plus every face crop"""
+        size = annotated_frame.nbytes if annotated_frame is not None else 0
+        return size + sum(face['image'].nbytes for face in face_records if face.get('image') is not None)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[:2]
+
+    def put(self, key, face_records, annotated_frame):
+        size = self.entry_bytes(face_records, annotated_frame)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous[2]
+            # An image bigger than the whole budget would only evict everything else
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (face_records, annotated_frame, size)
+            self.total_bytes += size
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+_frame_cache = FrameResultCache()
+
+def get_frame_cache():
+    """Return the process-wide cache of analyzed snapshots and uploaded images"""
+    return _frame_cache
+
+class EmotionDetector:
+    """Per-session detection state; the models themselves live in the shared ModelRegistry"""
+
+    def __init__(self, detector_backend='skip', max_batch_size=32, registry=None,
+                 history_capacity=50000, face_capacity=256, face_detector_backend=None,
+                 detection_max_side=DETECTION_MAX_SIDE, emotion_backend=None,
+                 use_inference_server=USE_INFERENCE_SERVER):
+        self.registry = registry or get_model_registry()
+        # 'keras' or 'tflite_int8'; see emotion_inference.py
+        self.emotion_backend = emotion_backend or DEFAULT_EMOTION_BACKEND
+        # Classify through the process-wide server so faces from all sessions share forward passes
+        self.use_inference_server = use_inference_server
+        self.detection_max_side = detection_max_side
+        # 'mtcnn', 'mediapipe' or 'opencv_dnn'; see face_detectors.py
+        self.face_detector_backend = face_detector_backend or DEFAULT_FACE_DETECTOR
+        # 'skip' classifies the detected face crops directly; any other DeepFace backend
+        # (e.g. 'opencv', 'ssd', 'mtcnn') re-detects inside each crop first
+        self.detector_backend = detector_backend
+        self.max_batch_size = max_batch_size
+        self.emotions = list(EMOTION_LABELS)
+        self.emotion_history = EmotionHistory(history_capacity)
+        self.detected_faces = FaceBuffer(face_capacity)
         self.frame_count = 0
         self.min_confidence = 0.8
+        self.tracker = None
+        self._chart_data = None
+
+    @property
+    def detector(self):
+        return self.registry.get_face_detector(self.face_detector_backend)
 
     def preprocess_frame(self, frame):
         """Apply basic preprocessing to the frame"""
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         return rgb_frame
 
-    def detect_faces(self, frame):
+    def detect_faces(self, frame, face_detector=None):
         """Detect faces in a frame with error handling"""
         try:
-            faces = self.detector.detect_faces(frame)
+            faces = (face_detector or self.detector).detect_faces(frame)
             return [face for face in faces if face['confidence'] > self.min_confidence]
         except Exception as e:
             logging.error(f"Face detection error: {str(e)}")
             return []
 
+    def load_emotion_model(self):
+        """Return the shared emotion model for this detector's inference backend, or the server in front of it"""
+        if self.use_inference_server:
+            return self.registry.get_inference_server(self.emotion_backend)
+        return self.registry.get_emotion_model(self.emotion_backend)
+
+    def classify_face(self, face_img):
+        """Run the emotion model directly on an already-cropped face"""
+        return self.classify_faces([face_img])[0]
+
+    def classify_faces(self, face_imgs):
+        """Run the emotion model on a list of face crops in batched forward passes"""
+        model = self.load_emotion_model()
+        results = []
+        for start in range(0, len(face_imgs), self.max_batch_size):
+            chunk = face_imgs[start:start + self.max_batch_size]
+            batch = np.stack([preprocess_face(face_img) for face_img in chunk])[..., np.newaxis]
+            predictions = model.predict(batch, verbose=0)
+            scores = 100 * predictions / predictions.sum(axis=1, keepdims=True)
+            for row in scores:
+                index = int(np.argmax(row))
+                results.append((self.emotions[index], float(row[index])))
+        return results
+
     def analyze_emotion(self, face_img):
         """Analyze emotion in a face image with error handling"""
         try:
@@ -45,11 +289,16 @@ class EmotionDetector:
             elif face_img.shape[2] == 1:
                 face_img = cv2.cvtColor(face_img, cv2.COLOR_GRAY2RGB)
 
+            if self.detector_backend == 'skip':
+                return self.classify_face(face_img)
+
+            from deepface import DeepFace
+
             result = DeepFace.analyze(
                 face_img,
                 actions=['emotion'],
                 enforce_detection=False,
-                detector_backend='mtcnn'
+                detector_backend=self.detector_backend
             )
             emotion = result[0]['dominant_emotion'].lower()
             confidence = result[0]['emotion'][emotion]
@@ -58,79 +307,209 @@ class EmotionDetector:
             logging.error(f"Emotion analysis error: {str(e)}")
             return None, None
 
-    def process_frame(self, frame, is_image=False):
-        """Process a single frame or image to detect faces and emotions"""
-        rgb_frame = self.preprocess_frame(frame)
-        faces = self.detect_faces(rgb_frame)
-        frame_emotions = []
-
-        for face in faces:
-            x, y, w, h = face['box']
+    def analyze_emotions(self, face_imgs):
+        """Analyze emotions for several face images, batching when classifying directly"""
+        if not face_imgs:
+            return []
+        if self.detector_backend != 'skip':
+            return [self.analyze_emotion(face_img) for face_img in face_imgs]
+        try:
+            return self.classify_faces(face_imgs)
+        except Exception as e:
+            logging.error(f"Batched emotion analysis error: {str(e)}")
+            return [(None, None)] * len(face_imgs)
+
+    def downscale_for_detection(self, frame):
+        """Shrink a frame so its longest side is at most detection_max_side; returns (frame, scale)"""
+        height, width = frame.shape[:2]
+        longest = max(height, width)
+        if not self.detection_max_side or longest <= self.detection_max_side:
+            return frame, 1.0
+        scale = self.detection_max_side / longest
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA), scale
+
+    def extract_faces(self, frame, face_detector=None):
+        """Detect faces on a downscaled BGR frame and return full-resolution RGB crops with their clipped boxes"""
+        detection_frame, scale = self.downscale_for_detection(frame)
+        detection_rgb = self.preprocess_frame(detection_frame)
+        face_imgs = []
+        boxes = []
+        for face in self.detect_faces(detection_rgb, face_detector):
+            x, y, w, h = [int(round(value / scale)) for value in face['box']]
             x, y = max(0, x), max(0, y)
-            w = min(w, rgb_frame.shape[1] - x)
-            h = min(h, rgb_frame.shape[0] - y)
+            w = min(w, frame.shape[1] - x)
+            h = min(h, frame.shape[0] - y)
 
             if w <= 10 or h <= 10:
                 continue
 
-            face_img = rgb_frame[y:y+h, x:x+w]
+            if scale == 1.0:
+                face_img = detection_rgb[y:y+h, x:x+w]
+            else:
+                # Only the face region of the full-resolution frame is colour-converted
+                face_img = cv2.cvtColor(frame[y:y+h, x:x+w], cv2.COLOR_BGR2RGB)
             if face_img.size == 0:
                 continue
 
-            emotion, confidence = self.analyze_emotion(face_img)
+            face_imgs.append(face_img)
+            boxes.append((x, y, w, h))
+        return face_imgs, boxes
+
+    def build_face_records(self, face_imgs, boxes, results, track_ids=None):
+        """Combine face crops, boxes and (emotion, confidence) results into detected_faces entries"""
+        face_records = []
+        track_ids = track_ids or [None] * len(face_imgs)
+        for face_img, box, (emotion, confidence), track_id in zip(face_imgs, boxes, results, track_ids):
             if emotion and confidence and emotion in self.emotions:
-                frame_emotions.append(emotion)
-                self.detected_faces.append({
+                face_record = {
                     'image': face_img,
                     'emotion': emotion,
                     'confidence': confidence,
                     'timestamp': time.time(),
-                    'box': (x, y, w, h)
-                })
+                    'box': box
+                }
+                if track_id is not None:
+                    face_record['track_id'] = track_id
+                face_records.append(face_record)
+        return face_records
+
+    def analyze_frame(self, frame, return_rgb=True):
+        """Detect and classify faces in a frame without touching session state.
+
+        The full-frame RGB conversion is only needed for display, so callers that
+        ignore it can pass return_rgb=False and get None instead.
+        """
+        face_imgs, boxes = self.extract_faces(frame)
+        face_records = self.build_face_records(face_imgs, boxes, self.analyze_emotions(face_imgs))
+        return face_records, self.preprocess_frame(frame) if return_rgb else None
+
+    def analyze_tracked_frame(self, frame, tracker, timestamp=None, return_rgb=True):
+        """Like analyze_frame, but only classify faces the tracker reports as new, stale or changed"""
+        face_imgs, boxes = self.extract_faces(frame)
+        face_records = self.classify_tracked([(face_imgs, boxes, timestamp)], tracker)[0]
+        return face_records, self.preprocess_frame(frame) if return_rgb else None
+
+    def classify_tracked(self, frames, tracker):
+        """Classify the faces of consecutive frames in one batch, reusing results the tracker carries forward.
+
+        frames is a list of (face_imgs, boxes, timestamp) in frame order; returns the face records of each frame.
+        """
+        assignments = [tracker.assign(face_imgs, boxes) for face_imgs, boxes, _ in frames]
+        stale = [
+            (frame_number, i)
+            for frame_number, frame_assignments in enumerate(assignments)
+            for i, (_, cached_result) in enumerate(frame_assignments) if cached_result is None
+        ]
+        fresh_results = self.analyze_emotions([frames[frame_number][0][i] for frame_number, i in stale])
+        results = [[cached_result for _, cached_result in frame_assignments] for frame_assignments in assignments]
+        for (frame_number, i), result in zip(stale, fresh_results):
+            results[frame_number][i] = result
+            if result[0] is not None:
+                tracker.store_result(assignments[frame_number][i][0], result)
+
+        all_records = []
+        for (face_imgs, boxes, timestamp), frame_assignments, frame_results in zip(frames, assignments, results):
+            track_ids = [track_id for track_id, _ in frame_assignments]
+            face_records = self.build_face_records(face_imgs, boxes, frame_results, track_ids)
+            for face in face_records:
+                tracker.record(face['track_id'], face['timestamp'] if timestamp is None else timestamp,
+                               face['emotion'], face['confidence'])
+            all_records.append(face_records)
+        return all_records
+
+    def record_detections(self, face_records, timestamp=None):
+        """Append analyzed faces to detected_faces and emotion_history and return their emotions.
+
+        timestamp overrides the faces' wall-clock analysis time, e.g. with the frame's position in a video.
+        """
+        for face in face_records:
+            if timestamp is not None:
+                face = dict(face, timestamp=timestamp)
+            self.detected_faces.append(face)
+            self.emotion_history.append(face['emotion'], face['confidence'], face['timestamp'])
+        return [face['emotion'] for face in face_records]
 
-        self.emotion_history = self.emotion_history[-100:]  # Limit to last 100 emotions
-        self.detected_faces = self.detected_faces[-100:]  # Limit to last 100 faces
-        return frame_emotions, rgb_frame
+    def process_frame(self, frame, is_image=False):
+        """Process a single frame or image to detect faces and emotions"""
+        face_records, rgb_frame = self.analyze_frame(frame)
+        return self.record_detections(face_records), rgb_frame
 
-    def process_video(self, video_path, duration_seconds=30, max_frames=150, frame_skip=5):
+    def process_video(self, video_path, duration_seconds=30, max_frames=150, frame_skip=5,
+                      sampling='fps', target_fps=10, num_frames=None,
+                      pipelined=False, detection_workers=None, workers=1, track_faces=False):
         """Process video file for emotion detection"""
-        self.reset()
+        if track_faces and workers > 1:
+            raise ValueError("track_faces needs frames in order and cannot be combined with workers > 1")
+        self.reset(video_time=True)
+        self.tracker = FaceTracker() if track_faces else None
+        sampler = FrameSampler(
+            video_path,
+            strategy=sampling,
+            target_fps=target_fps,
+            num_frames=num_frames,
+            # num_frames already bounds the work for the count strategy, so spread them over the whole clip
+            max_frames=None if sampling == 'count' else max_frames,
+            frame_skip=frame_skip
+        )
+        frames = None
         try:
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                logging.error(f"Could not open video file: {video_path}")
+            if sampling != 'keyframes' and not sampler.open():
                 st.error(f"Could not open video file: {video_path}")
                 return []
 
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            if fps > 0:
-                frame_skip = max(1, int(fps / 10))
-
-            frame_count = 0
             processed_count = 0
             start_time = time.time()
+            expected_count = None
+            if sampling != 'keyframes':
+                target_indices = sampler.target_indices()
+                # fps sampling of a video with unknown length yields an endless index iterator
+                expected_count = len(target_indices) if hasattr(target_indices, '__len__') else None
 
             progress_bar = st.progress(0)
             status_text = st.empty()
 
-            while frame_count < max_frames and (time.time() - start_time) < duration_seconds:
-                ret, frame = cap.read()
-                if not ret:
-                    break
+            if workers > 1 and sampling != 'keyframes':
+                if expected_count is None:
+                    raise ValueError("Video length is unknown; pass max_frames to analyze it with workers > 1")
+                frames = analyze_video_segments(
+                    video_path,
+                    sampler.target_indices(),
+                    workers,
+                    detector_backend=self.detector_backend,
+                    face_detector_backend=self.face_detector_backend,
+                    emotion_backend=self.emotion_backend,
+                    max_batch_size=self.max_batch_size
+                )
+            elif pipelined:
+                frames = VideoPipeline(self, detection_workers=detection_workers, tracker=self.tracker).run(sampler)
+            elif track_faces:
+                frames = (
+                    (frame_index, timestamp, self.analyze_tracked_frame(frame, self.tracker, timestamp, return_rgb=False)[0])
+                    for frame_index, timestamp, frame in sampler
+                )
+            else:
+                frames = (
+                    (frame_index, timestamp, self.analyze_frame(frame, return_rgb=False)[0])
+                    for frame_index, timestamp, frame in sampler
+                )
 
-                frame_count += 1
-                if frame_count % frame_skip != 0:
-                    continue
+            for frame_index, timestamp, face_records in frames:
+                if (time.time() - start_time) >= duration_seconds:
+                    break
 
-                progress = min(1.0, frame_count / max_frames)
-                progress_bar.progress(progress)
-                status_text.text(f"Processing frame {frame_count}/{max_frames}")
+                if expected_count:
+                    progress_bar.progress(min(1.0, (processed_count + 1) / expected_count))
+                    status_text.text(f"Processing frame {processed_count + 1}/{expected_count}")
+                elif sampler.frame_limit:
+                    progress_bar.progress(min(1.0, (frame_index + 1) / sampler.frame_limit))
+                    status_text.text(f"Processing frame {frame_index + 1}/{sampler.frame_limit}")
+                else:
+                    status_text.text(f"Processing frame {frame_index + 1}")
 
-                frame_emotions, _ = self.process_frame(frame)
-                self.emotion_history.extend(frame_emotions)
+                self.record_detections(face_records, timestamp)
                 processed_count += 1
 
-            cap.release()
             progress_bar.empty()
             status_text.empty()
 
@@ -145,8 +524,36 @@ class EmotionDetector:
             st.error(f"Error processing video: {str(e)}")
             return []
         finally:
-            if 'cap' in locals() and cap is not None:
-                cap.release()
+            if frames is not None:
+                frames.close()
+            sampler.release()
+
+    def emotion_chart_data(self):
+        """Distribution and timeline frames for the analytics charts, rebuilt only when the history changes"""
+        version = self.emotion_history.version
+        if self._chart_data is not None and self._chart_data[0] == version:
+            return self._chart_data[1], self._chart_data[2]
+
+        import pandas as pd
+
+        percentages = self.emotion_history.percentages()
+        distribution = pd.DataFrame({'percentage': list(percentages.values())}, index=list(percentages.keys()))
+
+        starts, bucket_counts = self.emotion_history.timeline()
+        # An epoch of 0 means the history holds seconds into a video rather than wall-clock times
+        if self.emotion_history.epoch:
+            index = pd.to_datetime(starts, unit='s')
+        else:
+            index = pd.Index(starts, name='seconds into video')
+        timeline = pd.DataFrame(
+            np.array(bucket_counts).reshape(len(starts), len(EMOTION_LABELS)),
+            index=index,
+            columns=EMOTION_LABELS
+        )
+        timeline = timeline.loc[:, timeline.sum() > 0]
+
+        self._chart_data = (version, distribution, timeline)
+        return distribution, timeline
 
     def display_emotion_analytics(self):
         """Display comprehensive emotion analytics in Streamlit"""
@@ -154,37 +561,29 @@ class EmotionDetector:
             st.warning("No emotions detected yet.")
             return
 
-        emotion_counts = Counter(self.emotion_history)
-        df = pd.DataFrame.from_dict(emotion_counts, orient='index', columns=['count'])
-        df['percentage'] = (df['count'] / len(self.emotion_history)) * 100
-        df = df.sort_values('count', ascending=False)
+        total = len(self.emotion_history)
+        most_common, count = self.emotion_history.most_common()
+        distribution, timeline = self.emotion_chart_data()
 
         st.subheader("Emotion Detection Summary")
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total Emotions Detected", len(self.emotion_history))
+            st.metric("Total Emotions Detected", total)
         with col2:
-            st.metric("Most Common Emotion", df.index[0])
+            st.metric("Most Common Emotion", most_common)
         with col3:
-            st.metric("Detection Rate", f"{df.iloc[0]['percentage']:.1f}%")
-
-        st.subheader("Emotion Distribution")
-        fig, ax = plt.subplots(figsize=(10, 5))
-        sns.barplot(x=df.index, y=df['percentage'])
-        plt.title("Emotion Distribution (%)")
-        plt.xticks(rotation=45)
-        plt.ylabel("Percentage")
-        plt.xlabel("Emotion")
-        st.pyplot(fig)
-
-        if len(self.emotion_history) > 10:
+            st.metric("Detection Rate", f"{100.0 * count / total:.1f}%")
+
+        st.subheader("Emotion Distribution (%)")
+        st.bar_chart(distribution)
+
+        if total > 10:
             st.subheader("Emotion Timeline")
-            fig, ax = plt.subplots(figsize=(10, 5))
-            emotion_series = pd.Series(self.emotion_history)
-            emotion_series.value_counts().plot(kind='pie', autopct='%1.1f%%')
-            plt.title("Emotion Distribution Over Time")
-            plt.ylabel('')
-            st.pyplot(fig)
+            st.caption(f"Detections per {self.emotion_history.bucket_seconds}s")
+            st.area_chart(timeline)
+
+        if self.tracker is not None and self.tracker.timelines:
+            self.display_track_timelines()
 
         if self.detected_faces:
             st.subheader("Recent Detections")
@@ -193,10 +592,38 @@ class EmotionDetector:
                 with cols[i]:
                     st.image(face['image'], caption=f"{face['emotion'].capitalize()}\n{face['confidence']:.1f}%", width=150)
 
-    def reset(self):
-        """Reset all emotion tracking data"""
-        self.emotion_history.clear()
-        self.detected_faces.clear()
+    def display_track_timelines(self):
+        """Show each tracked person's emotions over the video"""
+        import pandas as pd
+
+        timelines = self.tracker.timelines
+        st.subheader("Per-Person Emotion Timelines")
+        summary = pd.DataFrame([
+            {
+                'person': f"Person {track_id + 1}",
+                'first seen (s)': round(timeline[0][0], 1),
+                'last seen (s)': round(timeline[-1][0], 1),
+                'detections': len(timeline),
+                'dominant emotion': pd.Series([emotion for _, emotion, _ in timeline]).mode()[0]
+            }
+            for track_id, timeline in sorted(timelines.items())
+        ])
+        st.dataframe(summary, hide_index=True)
+
+        track_id = st.selectbox("Person", sorted(timelines), key="track_timeline_person", format_func=lambda track_id: f"Person {track_id + 1}")
+        rows = pd.DataFrame(timelines[track_id], columns=['seconds', 'emotion', 'confidence'])
+        chart = rows.pivot_table(index='seconds', columns='emotion', values='confidence', aggfunc='max')
+        st.caption("Confidence (%) of the emotion detected at each sampled moment")
+        st.line_chart(chart)
+
+    def reset(self, video_time=False):
+        """Reset all emotion tracking data; with video_time, timestamps are seconds into the video"""
+        if video_time:
+            self.emotion_history.clear(epoch=0.0, bucket_seconds=VIDEO_BUCKET_SECONDS)
+            self.detected_faces.clear(epoch=0.0)
+        else:
+            self.emotion_history.clear()
+            self.detected_faces.clear()
         self.frame_count = 0
 
     def save_results(self, output_dir='results'):
@@ -205,11 +632,13 @@ class EmotionDetector:
             os.makedirs(output_dir)
 
         if self.emotion_history:
+            import pandas as pd
+
             history_file = os.path.join(output_dir, f'emotion_history_{time.strftime("%Y%m%d_%H%M%S")}.csv')
             df = pd.DataFrame({
-                'emotion': self.emotion_history,
-                'timestamp': [face['timestamp'] for face in self.detected_faces],
-                'confidence': [face['confidence'] for face in self.detected_faces]
+                'emotion': list(self.emotion_history),
+                'timestamp': self.emotion_history.timestamp_array(),
+                'confidence': self.emotion_history.confidence_array()
             })
             df.to_csv(history_file, index=False)
             st.success(f"Emotion history saved to {history_file}")
@@ -0,0 +1,328 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+import multiprocessing
+import numpy as np
+
+# Setup logging
+logging.basicConfig(filename="emotion_errors.log", level=logging.INFO)
+
+# 'keras' runs DeepFace's full-precision model; 'tflite_int8' runs the exported int8 model
+EMOTION_BACKENDS = ('keras', 'tflite_int8')
+DEFAULT_EMOTION_BACKEND = os.getenv('EMOTION_MODEL_BACKEND', 'keras')
+EMOTION_TFLITE_PATH = os.getenv('EMOTION_TFLITE_PATH', 'emotion_int8.tflite')
+# The int8 model is only served once it picked the same dominant emotion as the Keras model
+# on at least this share of the reference faces
+PARITY_MIN_AGREEMENT = float(os.getenv('EMOTION_PARITY_MIN_AGREEMENT', 0.95))
+
+def load_tflite_interpreter(model_path, num_threads=None):
+    """Prefer the standalone tflite_runtime package so the int8 path never has to import TensorFlow"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+class QuantizedEmotionModel:
+    """int8 TFLite emotion model with the same predict() interface as the Keras model"""
+
+    def __init__(self, model_path=EMOTION_TFLITE_PATH, num_threads=None):
+        self.model_path = model_path
+        self.interpreter = load_tflite_interpreter(model_path, num_threads or os.cpu_count())
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self._input_shape = tuple(self.interpreter.get_input_details()[0]['shape'])
+        # A TFLite interpreter can only run one invocation at a time
+        self._lock = threading.Lock()
+
+    @property
+    def model_size_bytes(self):
+        return os.path.getsize(self.model_path)
+
+    def predict(self, batch, verbose=0):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self._lock:
+            if batch.shape != self._input_shape:
+                self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+                self.interpreter.allocate_tensors()
+                self._input_shape = batch.shape
+            self.interpreter.set_tensor(self.input_index, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index).copy()
+
+def model_digest(model_path):
+    with open(model_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def parity_report_path(model_path):
+    return f"{model_path}.parity.json"
+
+def save_parity_report(report, model_path):
+    """Store a parity result next to the model it was measured on"""
+    record = {key: value for key, value in report.items() if key != 'mismatches'}
+    record['model_sha256'] = model_digest(model_path)
+    with open(parity_report_path(model_path), 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+
+def passed_parity(model_path, min_agreement=PARITY_MIN_AGREEMENT):
+    """Whether this exact model file has a stored parity result at or above min_agreement"""
+    try:
+        with open(parity_report_path(model_path), 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        return report['model_sha256'] == model_digest(model_path) and report['agreement'] >= min_agreement
+    except (OSError, ValueError, KeyError):
+        return False
+
+def create_emotion_model(backend=None):
+    """Load the emotion model for a backend; the int8 model is used only if it exists and passed parity"""
+    backend = backend or DEFAULT_EMOTION_BACKEND
+    if backend not in EMOTION_BACKENDS:
+        raise ValueError(f"Unknown emotion model backend: {backend} (choose from {', '.join(EMOTION_BACKENDS)})")
+    if backend == 'tflite_int8':
+        if not os.path.exists(EMOTION_TFLITE_PATH):
+            logging.warning(f"{EMOTION_TFLITE_PATH} not found; run 'python emotion_inference.py export' "
+                            f"to create it. Using the Keras emotion model instead")
+        elif not passed_parity(EMOTION_TFLITE_PATH):
+            logging.warning(f"{EMOTION_TFLITE_PATH} has no passing parity check (agreement >= "
+                            f"{PARITY_MIN_AGREEMENT:.0%}); run 'python emotion_inference.py parity'. "
+                            f"Using the Keras emotion model instead")
+        else:
+            return QuantizedEmotionModel(EMOTION_TFLITE_PATH)
+    from deepface import DeepFace
+    return DeepFace.build_model('Emotion')
+
+def keras_weights_bytes(model):
+    return sum(weights.nbytes for weights in model.get_weights())
+
+def _peak_rss_child(backend, model_path, input_shape, runs):
+    """Load one backend in a fresh process, run it, and return that process's peak RSS in MB"""
+    import resource
+
+    if backend == 'keras':
+        from deepface import DeepFace
+        model = DeepFace.build_model('Emotion')
+    else:
+        model = QuantizedEmotionModel(model_path)
+    inputs = np.random.rand(*input_shape).astype(np.float32)
+    for _ in range(runs):
+        model.predict(inputs, verbose=0)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+def measure_peak_rss(backend, model_path=EMOTION_TFLITE_PATH, input_shape=(32, 48, 48, 1), runs=5):
+    """Peak resident memory (MB) of a process that serves only this backend"""
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(_peak_rss_child, (backend, model_path, input_shape, runs))
+
+def collect_faces(image_paths, detector):
+    """Detect faces in reference images; returns the crops and the image each came from"""
+    import cv2
+
+    faces = []
+    sources = []
+    for path in image_paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            logging.warning(f"Skipping unreadable image: {path}")
+            continue
+        face_imgs, _ = detector.extract_faces(frame)
+        faces.extend(face_imgs)
+        sources.extend([path] * len(face_imgs))
+    return faces, sources
+
+def face_batch(faces):
+    from emotion_detector import preprocess_face
+
+    return np.stack([preprocess_face(face_img) for face_img in faces])[..., np.newaxis]
+
+def export_tflite_int8(keras_model, calibration_batch, output_path=EMOTION_TFLITE_PATH):
+    """Convert the Keras emotion model to full-integer int8, calibrating activations on real faces"""
+    import tensorflow as tf
+
+    def representative_dataset():
+        for face in calibration_batch:
+            yield [face[np.newaxis].astype(np.float32)]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    tflite_model = converter.convert()
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(tflite_model)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def check_parity(keras_model, quantized_model, batch, sources=None, min_agreement=PARITY_MIN_AGREEMENT):
+    """Whether the int8 model's dominant emotion matches the Keras model's on at least min_agreement of the faces"""
+    from ring_buffer import EMOTION_LABELS
+
+    reference = keras_model.predict(batch, verbose=0)
+    quantized = quantized_model.predict(batch)
+    reference_codes = reference.argmax(axis=1)
+    quantized_codes = quantized.argmax(axis=1)
+    reference_scores = 100 * reference / reference.sum(axis=1, keepdims=True)
+    quantized_scores = 100 * quantized / quantized.sum(axis=1, keepdims=True)
+    sources = sources or [None] * len(batch)
+    agreement = float(np.mean(reference_codes == quantized_codes))
+    return {
+        'faces': len(batch),
+        'agreement': agreement,
+        'min_agreement': min_agreement,
+        'passed': agreement >= min_agreement,
+        'max_score_diff': float(np.max(np.abs(reference_scores - quantized_scores))),
+        'mismatches': [
+            (source, EMOTION_LABELS[expected], EMOTION_LABELS[found])
+            for source, expected, found in zip(sources, reference_codes, quantized_codes) if expected != found
+        ]
+    }
+
+def deepface_emotion(face_img, detector_backend):
+    """(dominant emotion, its score) from DeepFace.analyze on one face crop"""
+    from deepface import DeepFace
+
+    result = DeepFace.analyze(face_img, actions=['emotion'], enforce_detection=False,
+                              detector_backend=detector_backend)
+    emotion = result[0]['dominant_emotion'].lower()
+    return emotion, float(result[0]['emotion'][emotion])
+
+def check_deepface_parity(detector, faces, sources=None, reference_backends=('skip', 'mtcnn'),
+                          min_agreement=PARITY_MIN_AGREEMENT):
+    """Compare the detector's direct classify_faces path with DeepFace.analyze on the same crops.
+
+    Only agreement with the 'skip' backend is gated: it runs the same preprocessing and model.
+    'mtcnn' re-detects and aligns a face inside each crop, so it is reported as expected drift.
+    """
+    direct = detector.classify_faces(faces)
+    sources = sources or [None] * len(faces)
+    backends = {}
+    for backend in reference_backends:
+        agreed = 0
+        confidence_diffs = []
+        mismatches = []
+        for face_img, source, (expected, confidence) in zip(faces, sources, direct):
+            try:
+                found, reference_confidence = deepface_emotion(face_img, backend)
+            except Exception as e:
+                logging.error(f"DeepFace parity error on {source}: {str(e)}")
+                found, reference_confidence = None, None
+            if found == expected:
+                agreed += 1
+                confidence_diffs.append(abs(confidence - reference_confidence))
+            else:
+                mismatches.append((source, expected, found))
+        backends[backend] = {
+            'agreement': agreed / len(faces) if faces else 1.0,
+            'mean_confidence_diff': float(np.mean(confidence_diffs)) if confidence_diffs else 0.0,
+            'max_confidence_diff': float(np.max(confidence_diffs)) if confidence_diffs else 0.0,
+            'mismatches': mismatches
+        }
+    return {
+        'faces': len(faces),
+        'min_agreement': min_agreement,
+        'passed': 'skip' not in backends or backends['skip']['agreement'] >= min_agreement,
+        'backends': backends
+    }
+
+def benchmark(keras_model, quantized_model, batch, batch_sizes=(1, 8, 32), runs=20, measure_memory=True):
+    """Per-face latency of both models at several batch sizes, their model sizes, and each
+    backend's peak RSS measured in a separate process that loads only that backend"""
+    rows = []
+    for name, model, model_size_bytes in (
+        ('keras', keras_model, keras_weights_bytes(keras_model)),
+        ('tflite_int8', quantized_model, quantized_model.model_size_bytes)
+    ):
+        peak_rss_mb = measure_peak_rss(name, quantized_model.model_path) if measure_memory else None
+        for batch_size in batch_sizes:
+            inputs = np.resize(batch, (batch_size,) + batch.shape[1:]).astype(np.float32)
+            model.predict(inputs, verbose=0)
+            start = time.perf_counter()
+            for _ in range(runs):
+                model.predict(inputs, verbose=0)
+            elapsed = time.perf_counter() - start
+            rows.append({
+                'backend': name,
+                'batch_size': batch_size,
+                'ms_per_face': elapsed * 1000 / (runs * batch_size),
+                'model_size_mb': model_size_bytes / 2 ** 20,
+                'peak_rss_mb': peak_rss_mb
+            })
+    return rows
+
+def run_parity(keras_model, model_path, batch, sources, min_agreement=PARITY_MIN_AGREEMENT):
+    """Check a model file, store the result next to it and print it; returns whether it passed"""
+    report = check_parity(keras_model, QuantizedEmotionModel(model_path), batch, sources, min_agreement)
+    save_parity_report(report, model_path)
+    verdict = "PASS" if report['passed'] else "FAIL"
+    print(f"{verdict}: {report['faces']} faces, dominant emotion agreement {report['agreement']:.1%} "
+          f"(required {min_agreement:.0%}), max score difference {report['max_score_diff']:.1f} points")
+    for source, expected, found in report['mismatches']:
+        print(f"  {source}: keras {expected}, int8 {found}")
+    return report['passed']
+
+def run_deepface_parity(detector, faces, sources, min_agreement=PARITY_MIN_AGREEMENT):
+    """Print the direct path's agreement with each DeepFace.analyze backend; returns whether 'skip' passed"""
+    report = check_deepface_parity(detector, faces, sources, min_agreement=min_agreement)
+    print(f"{report['faces']} faces, direct classify_faces vs DeepFace.analyze "
+          f"('skip' must agree on {min_agreement:.0%}; 'mtcnn' is the pre-skip path and may drift)")
+    print(f"{'backend':>8} {'agreement':>9} {'mean diff':>9} {'max diff':>8}")
+    for backend, row in report['backends'].items():
+        print(f"{backend:>8} {row['agreement']:>9.1%} {row['mean_confidence_diff']:>9.2f} "
+              f"{row['max_confidence_diff']:>8.2f}")
+    for backend, row in report['backends'].items():
+        for source, expected, found in row['mismatches']:
+            print(f"  {backend} {source}: direct {expected}, DeepFace {found}")
+    print("PASS" if report['passed'] else "FAIL")
+    return report['passed']
+
+if __name__ == '__main__':
+    from emotion_detector import EmotionDetector
+    from face_detectors import list_images
+
+    parser = argparse.ArgumentParser(description="Export, verify and benchmark the int8 emotion model, "
+                                                 "or check the direct path against DeepFace.analyze")
+    parser.add_argument('command', choices=['export', 'parity', 'benchmark', 'deepface-parity'])
+    parser.add_argument('paths', nargs='+', help="reference face images or directories")
+    parser.add_argument('--model-path', default=EMOTION_TFLITE_PATH)
+    parser.add_argument('--min-agreement', type=float, default=PARITY_MIN_AGREEMENT)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--skip-memory', action='store_true', help="don't measure peak RSS in subprocesses")
+    args = parser.parse_args()
+
+    detector = EmotionDetector(emotion_backend='keras', use_inference_server=False)
+    faces, sources = collect_faces(list_images(args.paths), detector)
+    if not faces:
+        raise SystemExit("No faces found in the reference images")
+    if args.command == 'deepface-parity':
+        sys.exit(0 if run_deepface_parity(detector, faces, sources, args.min_agreement) else 1)
+    batch = face_batch(faces)
+    keras_model = detector.load_emotion_model()
+
+    if args.command == 'export':
+        export_tflite_int8(keras_model, batch, args.model_path)
+        print(f"Wrote {args.model_path} calibrated on {len(faces)} faces")
+        # Parity is checked right away so the backend is only enabled for a model that passed
+        if not run_parity(keras_model, args.model_path, batch, sources, args.min_agreement):
+            sys.exit(1)
+    elif args.command == 'parity':
+        if not run_parity(keras_model, args.model_path, batch, sources, args.min_agreement):
+            sys.exit(1)
+    else:
+        rows = benchmark(keras_model, QuantizedEmotionModel(args.model_path), batch, runs=args.runs,
+                         measure_memory=not args.skip_memory)
+        print(f"{'backend':>11} {'batch':>5} {'ms/face':>8} {'model MB':>9} {'peak RSS MB':>11}")
+        for row in rows:
+            peak_rss = f"{row['peak_rss_mb']:>11.0f}" if row['peak_rss_mb'] is not None else f"{'-':>11}"
+            print(f"{row['backend']:>11} {row['batch_size']:>5} {row['ms_per_face']:>8.2f} "
+                  f"{row['model_size_mb']:>9.2f} {peak_rss}")
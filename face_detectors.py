@@ -0,0 +1,220 @@
+import os
+import time
+import logging
+import argparse
+import threading
+import urllib.request
+import cv2
+import numpy as np
+
+from face_tracker import box_iou
+
+# Setup logging
+logging.basicConfig(filename="emotion_errors.log", level=logging.INFO)
+
+# Backend used when a detector is not given one explicitly; pick per deployment with compare_backends
+DEFAULT_FACE_DETECTOR = os.getenv('FACE_DETECTOR_BACKEND', 'mtcnn')
+
+# OpenCV's ResNet-10 SSD face model, the same files DeepFace's 'ssd' backend downloads
+OPENCV_DNN_DIR = os.getenv('OPENCV_DNN_DIR', os.path.join(os.path.expanduser('~'), '.deepface', 'weights'))
+OPENCV_DNN_FILES = {
+    'deploy.prototxt':
+        'https://github.com/opencv/opencv/raw/3.4.0/samples/dnn/face_detector/deploy.prototxt',
+    'res10_300x300_ssd_iter_140000.caffemodel':
+        'https://github.com/opencv/opencv_3rdparty/raw/dnn_samples_face_detector_20170830/'
+        'res10_300x300_ssd_iter_140000.caffemodel'
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+def face_result(x, y, w, h, confidence):
+    """Detection in the shape every backend returns: an (x, y, w, h) pixel box and a 0-1 confidence"""
+    return {'box': [int(x), int(y), int(w), int(h)], 'confidence': float(confidence)}
+
+class MTCNNFaceDetector:
+    """MTCNN cascade: the most accurate on small and rotated faces, and the slowest on CPU"""
+
+    name = 'mtcnn'
+
+    def __init__(self):
+        from mtcnn import MTCNN
+        self.model = MTCNN()
+        # The shared instance is called from every session's script thread and the live-stream
+        # workers; MTCNN's Keras networks are not safe to run concurrently
+        self._lock = threading.Lock()
+
+    def detect_faces(self, rgb_frame):
+        with self._lock:
+            faces = self.model.detect_faces(rgb_frame)
+        return [face_result(*face['box'], face['confidence']) for face in faces]
+
+class MediaPipeFaceDetector:
+    """MediaPipe BlazeFace: very fast on CPU, best on frontal faces"""
+
+    name = 'mediapipe'
+
+    def __init__(self, model_selection=1, min_detection_confidence=0.5):
+        import mediapipe as mp
+        # model_selection 0 suits faces within ~2m of a webcam, 1 handles faces up to ~5m away
+        self.model = mp.solutions.face_detection.FaceDetection(
+            model_selection=model_selection,
+            min_detection_confidence=min_detection_confidence
+        )
+        # A MediaPipe graph handles one image at a time
+        self._lock = threading.Lock()
+
+    def detect_faces(self, rgb_frame):
+        height, width = rgb_frame.shape[:2]
+        with self._lock:
+            results = self.model.process(np.ascontiguousarray(rgb_frame))
+        faces = []
+        for detection in results.detections or []:
+            box = detection.location_data.relative_bounding_box
+            faces.append(face_result(box.xmin * width, box.ymin * height,
+                                     box.width * width, box.height * height, detection.score[0]))
+        return faces
+
+class OpenCVDNNFaceDetector:
+    """OpenCV DNN ResNet-10 SSD: fast on CPU and more robust than Haar cascades"""
+
+    name = 'opencv_dnn'
+
+    def __init__(self, model_dir=OPENCV_DNN_DIR, input_size=(300, 300), min_detection_confidence=0.5):
+        prototxt, caffemodel = [self._ensure_file(model_dir, filename) for filename in OPENCV_DNN_FILES]
+        self.model = cv2.dnn.readNetFromCaffe(prototxt, caffemodel)
+        self.input_size = input_size
+        self.min_detection_confidence = min_detection_confidence
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _ensure_file(model_dir, filename):
+        path = os.path.join(model_dir, filename)
+        if not os.path.exists(path):
+            os.makedirs(model_dir, exist_ok=True)
+            logging.info(f"Downloading {filename} to {model_dir}")
+            urllib.request.urlretrieve(OPENCV_DNN_FILES[filename], f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        return path
+
+    def detect_faces(self, rgb_frame):
+        height, width = rgb_frame.shape[:2]
+        # The model was trained on BGR input with these channel means
+        blob = cv2.dnn.blobFromImage(cv2.resize(rgb_frame, self.input_size), 1.0, self.input_size,
+                                     (104.0, 177.0, 123.0), swapRB=True)
+        with self._lock:
+            self.model.setInput(blob)
+            detections = self.model.forward()[0, 0]
+
+        faces = []
+        for _, _, confidence, x1, y1, x2, y2 in detections:
+            if confidence < self.min_detection_confidence:
+                continue
+            x1, x2 = max(0.0, x1) * width, min(1.0, x2) * width
+            y1, y2 = max(0.0, y1) * height, min(1.0, y2) * height
+            if x2 > x1 and y2 > y1:
+                faces.append(face_result(x1, y1, x2 - x1, y2 - y1, confidence))
+        return faces
+
+FACE_DETECTOR_BACKENDS = {
+    MTCNNFaceDetector.name: MTCNNFaceDetector,
+    MediaPipeFaceDetector.name: MediaPipeFaceDetector,
+    OpenCVDNNFaceDetector.name: OpenCVDNNFaceDetector
+}
+
+def create_face_detector(backend=None):
+    """Instantiate a face detector backend by name"""
+    backend = backend or DEFAULT_FACE_DETECTOR
+    if backend not in FACE_DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown face detector backend: {backend} (choose from {', '.join(FACE_DETECTOR_BACKENDS)})")
+    return FACE_DETECTOR_BACKENDS[backend]()
+
+def list_images(paths):
+    """Expand files and directories into a sorted list of image paths"""
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, filenames in os.walk(path):
+                images.extend(os.path.join(root, filename) for filename in filenames
+                              if filename.lower().endswith(IMAGE_EXTENSIONS))
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            images.append(path)
+    return sorted(images)
+
+def match_faces(reference_boxes, boxes, iou_threshold=0.5):
+    """Number of boxes that greedily pair up with a distinct reference box at or above iou_threshold"""
+    pairs = sorted(
+        ((box_iou(reference_box, box), i, j)
+         for i, reference_box in enumerate(reference_boxes) for j, box in enumerate(boxes)),
+        reverse=True
+    )
+    used_reference, used = set(), set()
+    for iou, i, j in pairs:
+        if iou < iou_threshold:
+            break
+        if i not in used_reference and j not in used:
+            used_reference.add(i)
+            used.add(j)
+    return len(used)
+
+def compare_backends(image_paths, backends=None, reference='mtcnn', min_confidence=0.8, iou_threshold=0.5):
+    """Per-frame latency of each backend and its agreement with the reference backend's detections"""
+    backends = list(backends or FACE_DETECTOR_BACKENDS)
+    if reference not in backends:
+        backends.insert(0, reference)
+    frames = []
+    for path in image_paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            logging.warning(f"Skipping unreadable image: {path}")
+            continue
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    if not frames:
+        raise ValueError("No readable images to compare on")
+
+    boxes_by_backend = {}
+    rows = []
+    for backend in backends:
+        detector = create_face_detector(backend)
+        # The first call pays for graph building and allocation; keep it out of the timings
+        detector.detect_faces(frames[0])
+        latencies = []
+        boxes_per_frame = []
+        for frame in frames:
+            start = time.perf_counter()
+            faces = detector.detect_faces(frame)
+            latencies.append((time.perf_counter() - start) * 1000)
+            boxes_per_frame.append([face['box'] for face in faces if face['confidence'] > min_confidence])
+        boxes_by_backend[backend] = boxes_per_frame
+        rows.append({
+            'backend': backend,
+            'frames': len(frames),
+            'mean_ms': float(np.mean(latencies)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'faces': sum(len(boxes) for boxes in boxes_per_frame)
+        })
+
+    reference_boxes = boxes_by_backend[reference]
+    reference_faces = sum(len(boxes) for boxes in reference_boxes)
+    for row in rows:
+        matched = sum(match_faces(expected, found, iou_threshold)
+                      for expected, found in zip(reference_boxes, boxes_by_backend[row['backend']]))
+        row['recall'] = matched / reference_faces if reference_faces else 1.0
+        row['precision'] = matched / row['faces'] if row['faces'] else 1.0
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare face detector backends on a local image set")
+    parser.add_argument('paths', nargs='+', help="image files or directories")
+    parser.add_argument('--backends', nargs='+', choices=list(FACE_DETECTOR_BACKENDS), default=None)
+    parser.add_argument('--reference', choices=list(FACE_DETECTOR_BACKENDS), default='mtcnn')
+    parser.add_argument('--min-confidence', type=float, default=0.8)
+    parser.add_argument('--iou-threshold', type=float, default=0.5)
+    args = parser.parse_args()
+
+    image_paths = list_images(args.paths)
+    rows = compare_backends(image_paths, args.backends, args.reference, args.min_confidence, args.iou_threshold)
+    print(f"{len(image_paths)} images, agreement measured against {args.reference}")
+    print(f"{'backend':>11} {'mean ms':>8} {'p95 ms':>8} {'faces':>6} {'recall':>7} {'precision':>9}")
+    for row in rows:
+        print(f"{row['backend']:>11} {row['mean_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['faces']:>6} "
+              f"{row['recall']:>7.2f} {row['precision']:>9.2f}")
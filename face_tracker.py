@@ -0,0 +1,111 @@
+import cv2
+import numpy as np
+from collections import defaultdict
+
+# Size of the grayscale thumbnail used to notice that a tracked face has changed
+CHANGE_THUMBNAIL_SIZE = (16, 16)
+
+def box_iou(box_a, box_b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    intersection = inter_w * inter_h
+    union = aw * ah + bw * bh - intersection
+    return intersection / union if union > 0 else 0.0
+
+def centroid_distance(box_a, box_b):
+    """Distance between box centres, relative to the larger box side"""
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    distance = np.hypot((ax + aw / 2) - (bx + bw / 2), (ay + ah / 2) - (by + bh / 2))
+    return distance / max(aw, ah, bw, bh, 1)
+
+def face_thumbnail(face_img):
+    gray = cv2.cvtColor(face_img, cv2.COLOR_RGB2GRAY)
+    return cv2.resize(gray, CHANGE_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+class FaceTracker:
+    """Assign track IDs to faces across video frames and decide which faces need re-classification"""
+
+    def __init__(self, iou_threshold=0.3, centroid_threshold=0.5, refresh_interval=5,
+                 change_threshold=12.0, max_missed=5):
+        self.iou_threshold = iou_threshold
+        self.centroid_threshold = centroid_threshold
+        self.refresh_interval = refresh_interval
+        self.change_threshold = change_threshold
+        self.max_missed = max_missed
+        self.tracks = {}
+        self.timelines = defaultdict(list)
+        self.next_track_id = 0
+        self.frame_number = 0
+        self.classifications = 0
+        self.carried_forward = 0
+
+    def _match(self, boxes):
+        """Greedily match boxes to live tracks by IoU, falling back to centroid distance"""
+        candidates = []
+        for box_index, box in enumerate(boxes):
+            for track_id, track in self.tracks.items():
+                iou = box_iou(box, track['box'])
+                if iou >= self.iou_threshold:
+                    candidates.append((iou, box_index, track_id))
+                elif centroid_distance(box, track['box']) <= self.centroid_threshold:
+                    candidates.append((0.0, box_index, track_id))
+
+        matches = {}
+        used_tracks = set()
+        for _, box_index, track_id in sorted(candidates, key=lambda item: item[0], reverse=True):
+            if box_index in matches or track_id in used_tracks:
+                continue
+            matches[box_index] = track_id
+            used_tracks.add(track_id)
+        return matches
+
+    def assign(self, face_imgs, boxes):
+        """Return a (track_id, cached_result) pair per face; cached_result is None when the face must be classified"""
+        self.frame_number += 1
+        matches = self._match(boxes)
+        assignments = []
+        seen_tracks = set()
+        for box_index, (face_img, box) in enumerate(zip(face_imgs, boxes)):
+            thumbnail = face_thumbnail(face_img)
+            track_id = matches.get(box_index)
+            if track_id is None:
+                track_id = self.next_track_id
+                self.next_track_id += 1
+                self.tracks[track_id] = {'result': None, 'thumbnail': thumbnail, 'classified_at': 0}
+
+            seen_tracks.add(track_id)
+            track = self.tracks[track_id]
+            track['box'] = box
+            track['missed'] = 0
+            stale = self.frame_number - track['classified_at'] >= self.refresh_interval
+            changed = np.mean(np.abs(thumbnail - track['thumbnail'])) > self.change_threshold
+            if track['result'] is None or stale or changed:
+                track['thumbnail'] = thumbnail
+                assignments.append((track_id, None))
+            else:
+                self.carried_forward += 1
+                assignments.append((track_id, track['result']))
+
+        for track_id in list(self.tracks):
+            if track_id in seen_tracks:
+                continue
+            self.tracks[track_id]['missed'] += 1
+            if self.tracks[track_id]['missed'] > self.max_missed:
+                del self.tracks[track_id]
+        return assignments
+
+    def store_result(self, track_id, result):
+        """Remember a fresh classification so later frames can carry it forward"""
+        track = self.tracks.get(track_id)
+        if track is not None:
+            track['result'] = result
+            track['classified_at'] = self.frame_number
+        self.classifications += 1
+
+    def record(self, track_id, timestamp, emotion, confidence):
+        """Append a detection to the per-person emotion timeline"""
+        self.timelines[track_id].append((timestamp, emotion, confidence))
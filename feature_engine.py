@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+import numpy as np
+
+# Setup logging
+logging.basicConfig(filename="spotify_errors.log", level=logging.INFO)
+
+FEATURE_CATALOG_PATH = os.getenv('FEATURE_CATALOG_PATH', 'feature_catalog.json')
+FEATURE_NAMES = ['valence', 'energy', 'danceability']
+SONG_FIELDS = ['name', 'artist', 'url', 'preview_url', 'image_url']
+# Spotify's audio-features endpoint accepts at most this many IDs per call
+AUDIO_FEATURES_BATCH = 100
+
+def track_id_from_url(url):
+    return url.rstrip('/').rsplit('/', 1)[-1].split('?')[0] if url else None
+
+class LocalFeatureRecommender:
+    """In-process recommendations from a local catalog of tracks and their audio features"""
+
+    def __init__(self, catalog_path=FEATURE_CATALOG_PATH):
+        self.catalog_path = catalog_path
+        self.songs = []
+        self.features = np.empty((0, len(FEATURE_NAMES)), dtype=np.float32)
+        self.languages = np.empty(0, dtype=object)
+        self.load()
+
+    def __len__(self):
+        return len(self.songs)
+
+    def load(self, catalog_path=None):
+        """Load a catalog file of song records carrying language and audio feature values"""
+        catalog_path = catalog_path or self.catalog_path
+        if not os.path.exists(catalog_path):
+            return False
+        try:
+            with open(catalog_path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            self.set_catalog(records)
+            return True
+        except Exception as e:
+            logging.error(f"Feature catalog load error: {str(e)}")
+            return False
+
+    def set_catalog(self, records):
+        records = [record for record in records if all(record.get(name) is not None for name in FEATURE_NAMES)]
+        self.songs = [{field: record.get(field) for field in SONG_FIELDS} for record in records]
+        self.features = np.array(
+            [[record[name] for name in FEATURE_NAMES] for record in records], dtype=np.float32
+        ).reshape(-1, len(FEATURE_NAMES))
+        self.languages = np.array([record.get('language', '').lower() for record in records], dtype=object)
+
+    def save(self, catalog_path=None):
+        catalog_path = catalog_path or self.catalog_path
+        records = []
+        for song, features, language in zip(self.songs, self.features.tolist(), self.languages):
+            record = dict(song, language=language)
+            record.update(zip(FEATURE_NAMES, features))
+            records.append(record)
+        tmp_path = f"{catalog_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(tmp_path, catalog_path)
+
+    @staticmethod
+    def feature_bounds(audio_features):
+        """Split EMOTION_PARAMS audio features into (min, max, target) arrays ordered like FEATURE_NAMES"""
+        bounds = np.array([audio_features[name] for name in FEATURE_NAMES], dtype=np.float32)
+        return bounds[:, 0], bounds[:, 1], bounds[:, 2]
+
+    def rank(self, audio_features, language=None, limit=5):
+        """Indices of catalog tracks inside the feature ranges, nearest to the target point first"""
+        if not self.songs:
+            return np.empty(0, dtype=np.int64)
+        minimum, maximum, target = self.feature_bounds(audio_features)
+        mask = np.all((self.features >= minimum) & (self.features <= maximum), axis=1)
+        if language:
+            mask &= self.languages == language.lower()
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return candidates
+
+        distances = np.sum((self.features[candidates] - target) ** 2, axis=1)
+        if candidates.size > limit:
+            nearest = np.argpartition(distances, limit)[:limit]
+        else:
+            nearest = np.arange(candidates.size)
+        return candidates[nearest[np.argsort(distances[nearest])]]
+
+    def recommend(self, audio_features, language=None, limit=5):
+        """Return the songs closest to an emotion's audio-feature target"""
+        return [self.songs[i] for i in self.rank(audio_features, language, limit)]
+
+def build_catalog(recommender, index, catalog_path=FEATURE_CATALOG_PATH):
+    """Build a feature catalog from the playlist index by fetching audio features for its tracks;
+    raises ValueError instead of writing an empty catalog"""
+    songs_by_id = {}
+    for key, pool in index.snapshot().items():
+        language = key.split('|', 1)[1]
+        for song in pool:
+            track_id = track_id_from_url(song['url'])
+            if track_id and track_id not in songs_by_id:
+                songs_by_id[track_id] = dict(song, language=language)
+
+    track_ids = list(songs_by_id)
+    if not track_ids:
+        raise ValueError("The playlist index has no tracks; build it before the feature catalog")
+    records = []
+    for start in range(0, len(track_ids), AUDIO_FEATURES_BATCH):
+        batch = track_ids[start:start + AUDIO_FEATURES_BATCH]
+        try:
+            features = recommender.sp.audio_features(batch) or []
+        except Exception as e:
+            logging.warning(f"Audio features error: {str(e)}")
+            continue
+        for track_id, track_features in zip(batch, features):
+            if track_features:
+                record = songs_by_id[track_id]
+                record.update({name: track_features[name] for name in FEATURE_NAMES})
+                records.append(record)
+    if not records:
+        # Keep any existing catalog rather than replacing it with an empty one
+        raise ValueError(f"No audio features were returned for {len(track_ids)} indexed tracks")
+    if len(records) < len(track_ids):
+        logging.warning(f"Audio features missing for {len(track_ids) - len(records)} of {len(track_ids)} tracks")
+
+    engine = LocalFeatureRecommender(catalog_path)
+    engine.set_catalog(records)
+    engine.save()
+    return engine
+
+def benchmark(engine, recommender, emotion_params, language='english', limit=5, runs=20):
+    """Compare per-request latency of the local engine against the remote recommendations endpoint"""
+    results = {}
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        for params in emotion_params.values():
+            engine.recommend(params['audio_features'], language, limit)
+    results['local_ms'] = (time.perf_counter() - start) * 1000 / (runs * len(emotion_params))
+
+    if recommender is not None and recommender.sp:
+        start = time.perf_counter()
+        calls = 0
+        for emotion in emotion_params:
+            try:
+                recommender.sp.recommendations(**recommender.recommendation_params(emotion, language, limit))
+                calls += 1
+            except Exception as e:
+                logging.warning(f"Benchmark recommendation error: {str(e)}")
+        if calls:
+            results['api_ms'] = (time.perf_counter() - start) * 1000 / calls
+    return results
+
+_feature_engine = None
+_feature_engine_lock = threading.Lock()
+
+def get_feature_engine():
+    """Return the process-wide local feature engine"""
+    global _feature_engine
+    with _feature_engine_lock:
+        if _feature_engine is None:
+            _feature_engine = LocalFeatureRecommender()
+        return _feature_engine
+
+if __name__ == '__main__':
+    from spotify_recommender import SpotifyRecommender
+    from playlist_index import get_playlist_index
+
+    parser = argparse.ArgumentParser(description="Build or benchmark the local feature-space recommender")
+    parser.add_argument('command', choices=['build', 'benchmark'])
+    parser.add_argument('--language', default='english')
+    parser.add_argument('--limit', type=int, default=5)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--offline', action='store_true', help="benchmark the local engine only")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        recommender = SpotifyRecommender()
+        try:
+            engine = build_catalog(recommender, get_playlist_index())
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print(f"Wrote {len(engine)} tracks to {engine.catalog_path}")
+    else:
+        engine = get_feature_engine()
+        recommender = None if args.offline else SpotifyRecommender()
+        timings = benchmark(engine, recommender, SpotifyRecommender.EMOTION_PARAMS,
+                            args.language, args.limit, args.runs)
+        print(f"catalog size: {len(engine)} tracks")
+        for name, value in timings.items():
+            print(f"{name}: {value:.3f} ms per request")
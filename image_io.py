@@ -0,0 +1,74 @@
+import io
+import os
+import logging
+import cv2
+import numpy as np
+
+# Setup logging
+logging.basicConfig(filename="emotion_errors.log", level=logging.INFO)
+
+# Uploads are decoded at the largest 1/2, 1/4 or 1/8 scale whose longest side is still at least this; 0 disables
+DECODE_MAX_SIDE = int(os.getenv('DECODE_MAX_SIDE', 1920))
+
+REDUCED_DECODE_MODES = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+]
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+def read_image_header(image_bytes):
+    """(width, height, EXIF orientation) read from the image header without decoding any pixels"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        width, height = image.size
+        orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    return width, height, orientation
+
+def reduced_decode_mode(width, height, max_side=DECODE_MAX_SIDE):
+    """(factor, imdecode flag) for the coarsest reduced decode that keeps the longest side >= max_side"""
+    if max_side:
+        for factor, flag in REDUCED_DECODE_MODES:
+            if max(width, height) // factor >= max_side:
+                return factor, flag
+    return 1, cv2.IMREAD_COLOR
+
+def apply_exif_orientation(frame, orientation):
+    """Rotate or mirror a decoded frame so it is upright for the given EXIF orientation value"""
+    if orientation == 2:
+        return cv2.flip(frame, 1)
+    if orientation == 3:
+        return cv2.rotate(frame, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(frame, 0)
+    if orientation == 5:
+        return cv2.transpose(frame)
+    if orientation == 6:
+        return cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.rotate(cv2.transpose(frame), cv2.ROTATE_180)
+    if orientation == 8:
+        return cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return frame
+
+def decode_image(image_bytes, max_side=DECODE_MAX_SIDE):
+    """Decode encoded image bytes into an upright BGR frame, at reduced resolution when the image is oversized"""
+    # Wrap the upload's buffer instead of copying it into a bytearray and a new array
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    try:
+        width, height, orientation = read_image_header(image_bytes)
+    except Exception as e:
+        # Let OpenCV decode at full size and apply the EXIF orientation itself
+        logging.warning(f"Image header read error: {str(e)}")
+        frame = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    else:
+        _, flag = reduced_decode_mode(width, height, max_side)
+        frame = cv2.imdecode(buffer, flag | cv2.IMREAD_IGNORE_ORIENTATION)
+        if frame is not None:
+            frame = apply_exif_orientation(frame, orientation)
+
+    if frame is None:
+        raise ValueError("Could not decode image")
+    return frame
@@ -0,0 +1,173 @@
+import os
+import time
+import queue
+import logging
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+
+# Setup logging
+logging.basicConfig(filename="emotion_errors.log", level=logging.INFO)
+
+# Route every session's emotion classification through one shared micro-batching server
+USE_INFERENCE_SERVER = os.getenv('INFERENCE_SERVER', '0') == '1'
+INFERENCE_MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', 32))
+INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', 10))
+
+_SENTINEL = object()
+
+class InferenceServer:
+    """In-process micro-batching server: any thread submits preprocessed faces, one thread runs the model.
+
+    A batch closes when it reaches max_batch_size or when its oldest face has waited max_wait_ms,
+    so max_wait_ms bounds the queueing delay added for a lone request.
+    """
+
+    def __init__(self, model_loader, max_batch_size=INFERENCE_MAX_BATCH, max_wait_ms=INFERENCE_MAX_WAIT_MS,
+                 stats_window=1024):
+        self.model_loader = model_loader
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.queue_waits = deque(maxlen=stats_window)
+        self.latencies = deque(maxlen=stats_window)
+        self.batches = deque(maxlen=stats_window)
+        self.completed = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="inference-server", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_SENTINEL)
+            thread.join()
+
+    def submit(self, face_input):
+        """Queue one preprocessed face; the future resolves to the model's output row"""
+        if self._thread is None:
+            self.start()
+        future = Future()
+        self._queue.put((time.perf_counter(), face_input, future))
+        return future
+
+    def predict(self, batch, verbose=0, timeout=None):
+        """Model-compatible predict() that batches these rows together with other callers' faces"""
+        futures = [self.submit(face_input) for face_input in batch]
+        return np.stack([future.result(timeout) for future in futures])
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is _SENTINEL:
+            return None
+        batch = [item]
+        deadline = item[0] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _SENTINEL:
+                self._queue.put(_SENTINEL)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        model = None
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started_at = time.perf_counter()
+            try:
+                if model is None:
+                    model = self.model_loader()
+                outputs = model.predict(np.stack([face_input for _, face_input, _ in batch]), verbose=0)
+            except Exception as e:
+                logging.error(f"Inference server batch error: {str(e)}")
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            finished_at = time.perf_counter()
+            for (_, _, future), output in zip(batch, outputs):
+                future.set_result(output)
+            with self._lock:
+                self.queue_waits.extend(started_at - enqueued_at for enqueued_at, _, _ in batch)
+                self.latencies.extend(finished_at - enqueued_at for enqueued_at, _, _ in batch)
+                self.batches.append((started_at, finished_at, len(batch)))
+                self.completed += len(batch)
+
+    def stats(self):
+        """Throughput, batch size and queue-latency percentiles over the recent stats window"""
+        with self._lock:
+            queue_waits = np.array(self.queue_waits) * 1000
+            latencies = np.array(self.latencies) * 1000
+            batches = list(self.batches)
+            completed = self.completed
+        if not batches:
+            return {'completed': completed, 'queue_depth': self._queue.qsize()}
+        faces = sum(size for _, _, size in batches)
+        span = batches[-1][1] - batches[0][0]
+        return {
+            'completed': completed,
+            'queue_depth': self._queue.qsize(),
+            'faces_per_second': faces / span if span > 0 else 0.0,
+            'mean_batch_size': faces / len(batches),
+            'queue_p50_ms': float(np.percentile(queue_waits, 50)),
+            'queue_p99_ms': float(np.percentile(queue_waits, 99)),
+            'latency_p50_ms': float(np.percentile(latencies, 50)),
+            'latency_p99_ms': float(np.percentile(latencies, 99))
+        }
+
+def load_test(server, clients=8, requests_per_client=50, faces_per_request=2, input_shape=(48, 48, 1)):
+    """Simulate concurrent sessions each classifying a few faces at a time, then return the server stats"""
+    batch = np.random.rand(faces_per_request, *input_shape).astype(np.float32)
+    server.predict(batch)
+
+    def run_client(_):
+        for _ in range(requests_per_client):
+            server.predict(batch)
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(run_client, range(clients)))
+    return server.stats()
+
+if __name__ == '__main__':
+    from emotion_detector import get_model_registry
+
+    parser = argparse.ArgumentParser(description="Load-test the micro-batching inference server")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--faces', type=int, default=2)
+    parser.add_argument('--max-batch', type=int, nargs='+', default=[8, 16, 32, 64])
+    parser.add_argument('--max-wait-ms', type=float, nargs='+', default=[2, 5, 10, 20])
+    parser.add_argument('--emotion-backend', default=None)
+    args = parser.parse_args()
+
+    registry = get_model_registry()
+    registry.get_emotion_model(args.emotion_backend)
+    print(f"{'max batch':>9} {'wait ms':>7} {'faces/s':>8} {'batch':>6} {'queue p50':>9} {'queue p99':>9} {'p99 ms':>7}")
+    for max_batch in args.max_batch:
+        for max_wait_ms in args.max_wait_ms:
+            server = InferenceServer(lambda: registry.get_emotion_model(args.emotion_backend), max_batch, max_wait_ms)
+            stats = load_test(server, args.clients, args.requests, args.faces)
+            server.stop()
+            print(f"{max_batch:>9} {max_wait_ms:>7.1f} {stats['faces_per_second']:>8.1f} "
+                  f"{stats['mean_batch_size']:>6.1f} {stats['queue_p50_ms']:>9.2f} "
+                  f"{stats['queue_p99_ms']:>9.2f} {stats['latency_p99_ms']:>7.2f}")
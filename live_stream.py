@@ -0,0 +1,84 @@
+import av
+import time
+import threading
+import logging
+from collections import Counter
+from streamlit_webrtc import VideoProcessorBase
+
+from emotion_detector import EmotionDetector, annotate_frame
+
+# Setup logging
+logging.basicConfig(filename="emotion_errors.log", level=logging.INFO)
+
+RTC_CONFIGURATION = {"iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]}
+
+class EmotionVideoProcessor(VideoProcessorBase):
+    """Overlay the latest emotion results on every live frame while a worker analyzes a throttled subset"""
+
+    def __init__(self, target_latency=0.5, min_interval=0.2, max_interval=3.0):
+        self.detector = EmotionDetector()
+        self.target_latency = target_latency
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.latency = 0.0
+        self.current_emotion = None
+        self.face_records = []
+        self._pending = None
+        self._last_submit = 0.0
+        self._lock = threading.Lock()
+        self._frame_ready = threading.Event()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def recv(self, frame):
+        img = frame.to_ndarray(format="bgr24")
+        now = time.time()
+        if now - self._last_submit >= self.interval:
+            with self._lock:
+                # Overwrite any frame the worker has not picked up yet so stale frames are dropped
+                self._pending = (now, img)
+            self._last_submit = now
+            self._frame_ready.set()
+
+        with self._lock:
+            face_records = self.face_records
+        if face_records:
+            img = annotate_frame(img, face_records)
+        return av.VideoFrame.from_ndarray(img, format="bgr24")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if not self._frame_ready.wait(timeout=0.5):
+                continue
+            with self._lock:
+                pending, self._pending = self._pending, None
+                self._frame_ready.clear()
+            if pending is None:
+                continue
+
+            captured_at, img = pending
+            try:
+                face_records, _ = self.detector.analyze_frame(img, return_rgb=False)
+            except Exception as e:
+                logging.error(f"Live frame analysis error: {str(e)}")
+                continue
+
+            with self._lock:
+                self.face_records = face_records
+                if face_records:
+                    emotions = self.detector.record_detections(face_records)
+                    self.current_emotion = Counter(emotions).most_common(1)[0][0]
+            self._adapt(time.time() - captured_at)
+
+    def _adapt(self, latency):
+        """Back off the analysis rate while results lag behind the target, recover slowly otherwise"""
+        self.latency = latency
+        if latency > self.target_latency:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        else:
+            self.interval = max(self.min_interval, self.interval * 0.9)
+
+    def on_ended(self):
+        self._stopped.set()
@@ -0,0 +1,157 @@
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+def _mock_track(query, position):
+    track_id = f"mock{abs(hash((query, position))) % 10 ** 12:012d}"
+    return {
+        'id': track_id,
+        'name': f"{query.title()} Song {position + 1}",
+        'artists': [{'name': f"Mock Artist {position % 7 + 1}"}],
+        'external_urls': {'spotify': f"https://open.spotify.com/track/{track_id}"},
+        'preview_url': None,
+        'album': {'images': []}
+    }
+
+class MockSpotifyServer:
+    """Local stand-in for the Spotify token and Web API endpoints, with scriptable throttling and failures"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.latency = latency
+        self.rate_limit_responses = 0
+        self.retry_after = 1
+        self.error_responses = 0
+        self.request_count = 0
+        self.token_requests = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_prefix(self):
+        return f"{self.base_url}/v1/"
+
+    @property
+    def token_url(self):
+        return f"{self.base_url}/api/token"
+
+    def throttle(self, responses, retry_after=1):
+        """Answer the next API requests with 429 and a Retry-After header"""
+        with self._lock:
+            self.rate_limit_responses = responses
+            self.retry_after = retry_after
+
+    def fail(self, responses):
+        """Answer the next API requests with 503"""
+        with self._lock:
+            self.error_responses = responses
+
+    def _next_status(self):
+        with self._lock:
+            self.request_count += 1
+            if self.rate_limit_responses > 0:
+                self.rate_limit_responses -= 1
+                return 429
+            if self.error_responses > 0:
+                self.error_responses -= 1
+                return 503
+            return 200
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if urlparse(self.path).path != '/api/token':
+                    self._send_json(404, {'error': 'not found'})
+                    return
+                with server._lock:
+                    server.token_requests += 1
+                self._send_json(200, {'access_token': 'mock-token', 'token_type': 'Bearer', 'expires_in': 3600})
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                status = server._next_status()
+                if status == 429:
+                    self._send_json(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                                    {'Retry-After': str(server.retry_after)})
+                    return
+                if status == 503:
+                    self._send_json(503, {'error': {'status': 503, 'message': 'Service unavailable'}})
+                    return
+
+                url = urlparse(self.path)
+                params = {name: values[0] for name, values in parse_qs(url.query).items()}
+                limit = int(params.get('limit', 20))
+                offset = int(params.get('offset', 0))
+                # spotipy requests some endpoints with a trailing slash, e.g. audio-features/?ids=
+                path = url.path.rstrip('/')
+                if path == '/v1/search':
+                    query = params.get('q', '')
+                    items = [_mock_track(query, offset + i) for i in range(limit)]
+                    self._send_json(200, {'tracks': {'items': items}})
+                elif path == '/v1/recommendations':
+                    seed = params.get('seed_genres', params.get('seed_tracks', 'mock'))
+                    self._send_json(200, {'tracks': [_mock_track(seed, i) for i in range(limit)]})
+                elif path == '/v1/audio-features':
+                    ids = params.get('ids', '').split(',')
+                    features = [
+                        {'id': track_id, 'valence': (hash(track_id) % 100) / 100,
+                         'energy': (hash(track_id) // 100 % 100) / 100,
+                         'danceability': (hash(track_id) // 10000 % 100) / 100}
+                        for track_id in ids if track_id
+                    ]
+                    self._send_json(200, {'audio_features': features})
+                else:
+                    self._send_json(404, {'error': {'status': 404, 'message': 'not found'}})
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a local mock of the Spotify API")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    mock = MockSpotifyServer(port=args.port, latency=args.latency)
+    print(f"SPOTIFY_API_PREFIX={mock.api_prefix}")
+    print(f"SPOTIFY_TOKEN_URL={mock.token_url}")
+    mock.httpd.serve_forever()
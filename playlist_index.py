@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+
+# Setup logging
+logging.basicConfig(filename="spotify_errors.log", level=logging.INFO)
+
+PLAYLIST_INDEX_PATH = os.getenv('PLAYLIST_INDEX_PATH', 'playlist_index.json')
+PLAYLIST_INDEX_MAX_AGE = int(os.getenv('PLAYLIST_INDEX_MAX_AGE', 24 * 3600))
+
+class PlaylistIndex:
+    """Local pool of prefetched tracks per (emotion, language), served without touching the network"""
+
+    def __init__(self, path=PLAYLIST_INDEX_PATH, max_age=PLAYLIST_INDEX_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.built_at = 0.0
+        self.pools = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread = None
+        self.load()
+
+    @staticmethod
+    def make_key(emotion, language):
+        return f"{emotion.lower()}|{language.lower()}"
+
+    def load(self):
+        """Load the index file if present"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            with self._lock:
+                self.built_at = data.get('built_at', 0.0)
+                self.pools = data.get('pools', {})
+            return True
+        except Exception as e:
+            logging.error(f"Playlist index load error: {str(e)}")
+            return False
+
+    def save(self):
+        """Write the index atomically so readers never see a partial file"""
+        with self._lock:
+            data = {'built_at': self.built_at, 'pools': self.pools}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _is_fresh(self):
+        return bool(self.pools) and (time.time() - self.built_at) < self.max_age
+
+    def is_fresh(self):
+        with self._lock:
+            return self._is_fresh()
+
+    def pool(self, emotion, language, allow_stale=False):
+        """Copy of the indexed songs for a mood and language, or None when the index cannot serve them"""
+        with self._lock:
+            if not allow_stale and not self._is_fresh():
+                return None
+            pool = self.pools.get(self.make_key(emotion, language))
+            return list(pool) if pool else None
+
+    def snapshot(self):
+        """Consistent copy of every pool, safe to read while a background refresh replaces them"""
+        with self._lock:
+            return {key: list(pool) for key, pool in self.pools.items()}
+
+    def sample(self, emotion, language, limit=5, allow_stale=False):
+        """Return a random sample of indexed songs, or None when the index cannot serve the request"""
+        pool = self.pool(emotion, language, allow_stale)
+        if not pool:
+            return None
+        return random.sample(pool, min(limit, len(pool)))
+
+    def refresh(self, recommender, languages, pages=2, page_size=50):
+        """Prefetch a deduplicated pool of tracks for every emotion and language pair"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            pools = {}
+            for emotion, params in recommender.EMOTION_PARAMS.items():
+                for language in languages:
+                    songs = recommender.collect_songs(params['search_terms'][language], pages, page_size, language)
+                    if songs:
+                        pools[self.make_key(emotion, language)] = songs
+            if not pools:
+                logging.warning("Playlist index refresh fetched no songs; keeping the previous index")
+                return False
+            with self._lock:
+                self.pools = pools
+                self.built_at = time.time()
+            self.save()
+            logging.info(f"Playlist index refreshed with {sum(len(pool) for pool in pools.values())} songs")
+            return True
+        except Exception as e:
+            logging.error(f"Playlist index refresh error: {str(e)}")
+            return False
+        finally:
+            self._refresh_lock.release()
+
+    def start_background_refresh(self, recommender, languages, interval=600):
+        """Refresh the index on a daemon thread whenever it goes stale"""
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+
+        def run():
+            while True:
+                if not self.is_fresh():
+                    self.refresh(recommender, languages)
+                time.sleep(interval)
+
+        self._refresh_thread = threading.Thread(target=run, name="playlist-index-refresh", daemon=True)
+        self._refresh_thread.start()
+
+_playlist_index = None
+_playlist_index_lock = threading.Lock()
+
+def get_playlist_index():
+    """Return the process-wide playlist index"""
+    global _playlist_index
+    with _playlist_index_lock:
+        if _playlist_index is None:
+            _playlist_index = PlaylistIndex()
+        return _playlist_index
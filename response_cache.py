@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import closing
+
+# Setup logging
+logging.basicConfig(filename="spotify_errors.log", level=logging.INFO)
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ttl seconds, with an optional SQLite layer"""
+
+    def __init__(self, ttl=3600, max_entries=1024, disk_path=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_path:
+            self._init_disk()
+
+    @staticmethod
+    def make_key(endpoint, query, market, limit):
+        """Stable string key for a request, usable in memory and on disk"""
+        return json.dumps([endpoint, query, market, limit], sort_keys=True, default=str)
+
+    def _connect(self):
+        return sqlite3.connect(self.disk_path, timeout=5)
+
+    def _init_disk(self):
+        try:
+            directory = os.path.dirname(self.disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+        except Exception as e:
+            logging.error(f"Response cache disk init error: {str(e)}")
+            self.disk_path = None
+
+    def _read_disk(self, key, allow_stale=False):
+        try:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+        except Exception as e:
+            logging.warning(f"Response cache disk read error: {str(e)}")
+            return None
+        if row is None or (row[1] <= time.time() and not allow_stale):
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _write_disk(self, key, value, expires_at):
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at)
+                )
+        except Exception as e:
+            logging.warning(f"Response cache disk write error: {str(e)}")
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Return a cached value, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            # Expired entries stay until LRU eviction so get_stale can fall back to them
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        if self.disk_path:
+            entry = self._read_disk(key)
+            if entry is not None:
+                with self._lock:
+                    self._store(key, *entry)
+                    self.hits += 1
+                return entry[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get_stale(self, key):
+        """Return a cached value even if it has expired, for use while the upstream API is unavailable"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            return entry[0]
+        if self.disk_path:
+            entry = self._read_disk(key, allow_stale=True)
+            if entry is not None:
+                return entry[0]
+        return None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self.disk_path:
+            self._write_disk(key, value, expires_at)
+
+    def get_or_fetch(self, key, fetch):
+        """Return the cached value for key, calling fetch() and caching its result on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = fetch()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk_path:
+            try:
+                with closing(self._connect()) as conn, conn:
+                    conn.execute("DELETE FROM responses")
+            except Exception as e:
+                logging.warning(f"Response cache disk clear error: {str(e)}")
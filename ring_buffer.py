@@ -0,0 +1,202 @@
+import cv2
+import time
+import numpy as np
+
+# Same order as the emotion model's outputs; positions are the stored uint8 codes
+EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+EMOTION_CODES = {emotion: code for code, emotion in enumerate(EMOTION_LABELS)}
+# Face crops are kept as thumbnails that fit inside this size
+THUMBNAIL_SIZE = (96, 96)
+
+class _RingIndex:
+    """Bookkeeping shared by the ring buffers: maps logical positions to slots"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        # Timestamps are stored as float32 seconds relative to this epoch to keep sub-10ms precision
+        self.epoch = time.time()
+
+    def __len__(self):
+        return self.size
+
+    def _next_slot(self):
+        """Slot for a new item, overwriting the oldest one once the buffer is full"""
+        if self.size < self.capacity:
+            slot = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            slot = self.start
+            self.start = (self.start + 1) % self.capacity
+        return slot
+
+    def _slot(self, index):
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("ring buffer index out of range")
+        return (self.start + index) % self.capacity
+
+    def _ordered(self, array):
+        """Oldest-to-newest view of a per-slot array (a copy only when the buffer has wrapped)"""
+        end = self.start + self.size
+        if end <= self.capacity:
+            return array[self.start:end]
+        return np.concatenate((array[self.start:], array[:end - self.capacity]))
+
+    def clear(self, epoch=None):
+        """Empty the buffer; pass epoch=0.0 when timestamps will be seconds into a video"""
+        self.start = 0
+        self.size = 0
+        self.epoch = time.time() if epoch is None else epoch
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._item(self._slot(i)) for i in range(*index.indices(self.size))]
+        return self._item(self._slot(index))
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self._item(self._slot(i))
+
+class EmotionHistory(_RingIndex):
+    """Fixed-capacity emotion history stored as uint8 codes with float32 confidences and timestamps.
+
+    Per-emotion counts and time-bucketed counts are maintained on every append and eviction,
+    so analytics never have to rescan the history.
+    """
+
+    def __init__(self, capacity=50000, bucket_seconds=10):
+        super().__init__(capacity)
+        self.codes = np.zeros(capacity, dtype=np.uint8)
+        self.confidences = np.zeros(capacity, dtype=np.float32)
+        self.timestamps = np.zeros(capacity, dtype=np.float32)
+        self.bucket_seconds = bucket_seconds
+        self.default_bucket_seconds = bucket_seconds
+        self.counts = np.zeros(len(EMOTION_LABELS), dtype=np.int64)
+        self.buckets = {}
+        # Bumped on every change so views can tell whether their cached data is still current
+        self.version = 0
+
+    def _item(self, slot):
+        return EMOTION_LABELS[self.codes[slot]]
+
+    def _bucket(self, relative_timestamp):
+        return int((relative_timestamp + self.epoch) // self.bucket_seconds) * self.bucket_seconds
+
+    def _forget(self, slot):
+        """Remove the entry in slot from the running aggregates before it is overwritten"""
+        code = self.codes[slot]
+        self.counts[code] -= 1
+        bucket = self._bucket(float(self.timestamps[slot]))
+        bucket_counts = self.buckets.get(bucket)
+        if bucket_counts is not None:
+            bucket_counts[code] -= 1
+            if not bucket_counts.any():
+                del self.buckets[bucket]
+
+    def append(self, emotion, confidence=np.nan, timestamp=None):
+        if self.size == self.capacity:
+            self._forget(self.start)
+        slot = self._next_slot()
+        code = EMOTION_CODES[emotion]
+        relative_timestamp = (time.time() if timestamp is None else timestamp) - self.epoch
+        self.codes[slot] = code
+        self.confidences[slot] = confidence
+        self.timestamps[slot] = relative_timestamp
+
+        self.counts[code] += 1
+        bucket = self._bucket(float(self.timestamps[slot]))
+        if bucket not in self.buckets:
+            self.buckets[bucket] = np.zeros(len(EMOTION_LABELS), dtype=np.int64)
+        self.buckets[bucket][code] += 1
+        self.version += 1
+
+    def extend(self, emotions):
+        for emotion in emotions:
+            self.append(emotion)
+
+    def clear(self, epoch=None, bucket_seconds=None):
+        super().clear(epoch)
+        self.bucket_seconds = bucket_seconds or self.default_bucket_seconds
+        self.counts[:] = 0
+        self.buckets.clear()
+        self.version += 1
+
+    def most_common(self):
+        """(emotion, count) of the most frequent emotion, or (None, 0) when empty"""
+        if not self.size:
+            return None, 0
+        code = int(np.argmax(self.counts))
+        return EMOTION_LABELS[code], int(self.counts[code])
+
+    def percentages(self):
+        """Share of each detected emotion in percent, most frequent first"""
+        if not self.size:
+            return {}
+        order = np.argsort(-self.counts, kind='stable')
+        return {EMOTION_LABELS[code]: 100.0 * self.counts[code] / self.size for code in order if self.counts[code]}
+
+    def timeline(self):
+        """Bucket start times (seconds since the epoch, or into the video) and per-bucket emotion counts"""
+        starts = sorted(self.buckets)
+        return starts, [self.buckets[start] for start in starts]
+
+    def code_array(self):
+        return self._ordered(self.codes)
+
+    def confidence_array(self):
+        return self._ordered(self.confidences)
+
+    def timestamp_array(self):
+        """Absolute timestamps: seconds since the Unix epoch, or into the video when the epoch is 0"""
+        return self._ordered(self.timestamps).astype(np.float64) + self.epoch
+
+class FaceBuffer(_RingIndex):
+    """Fixed-capacity store of recent detections with face crops kept as preallocated thumbnails"""
+
+    def __init__(self, capacity=256, thumbnail_size=THUMBNAIL_SIZE):
+        super().__init__(capacity)
+        self.thumbnail_size = thumbnail_size
+        self.images = np.zeros((capacity, thumbnail_size[1], thumbnail_size[0], 3), dtype=np.uint8)
+        self.image_shapes = np.zeros((capacity, 2), dtype=np.int32)
+        self.codes = np.zeros(capacity, dtype=np.uint8)
+        self.confidences = np.zeros(capacity, dtype=np.float32)
+        self.timestamps = np.zeros(capacity, dtype=np.float32)
+        self.boxes = np.zeros((capacity, 4), dtype=np.int32)
+        self.track_ids = np.full(capacity, -1, dtype=np.int32)
+
+    def _item(self, slot):
+        height, width = self.image_shapes[slot]
+        face = {
+            'image': self.images[slot, :height, :width],
+            'emotion': EMOTION_LABELS[self.codes[slot]],
+            'confidence': float(self.confidences[slot]),
+            'timestamp': float(self.timestamps[slot]) + self.epoch,
+            'box': tuple(int(value) for value in self.boxes[slot])
+        }
+        if self.track_ids[slot] >= 0:
+            face['track_id'] = int(self.track_ids[slot])
+        return face
+
+    def append(self, face):
+        slot = self._next_slot()
+        image = face['image']
+        max_width, max_height = self.thumbnail_size
+        scale = min(max_width / image.shape[1], max_height / image.shape[0], 1.0)
+        width = max(1, int(image.shape[1] * scale))
+        height = max(1, int(image.shape[0] * scale))
+        if scale < 1.0:
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        self.images[slot, :height, :width] = image[:height, :width]
+        self.image_shapes[slot] = (height, width)
+        self.codes[slot] = EMOTION_CODES[face['emotion']]
+        self.confidences[slot] = face['confidence']
+        self.timestamps[slot] = face['timestamp'] - self.epoch
+        self.boxes[slot] = face['box']
+        self.track_ids[slot] = face.get('track_id', -1)
+
+    def extend(self, faces):
+        for face in faces:
+            self.append(face)
@@ -0,0 +1,192 @@
+import os
+import time
+import random
+import logging
+import threading
+import spotipy
+from requests.adapters import HTTPAdapter
+from spotipy.cache_handler import MemoryCacheHandler
+from spotipy.oauth2 import SpotifyClientCredentials
+
+# Setup logging
+logging.basicConfig(filename="spotify_errors.log", level=logging.INFO)
+
+# Point these at mock_spotify_server.py for local testing
+SPOTIFY_API_PREFIX = os.getenv('SPOTIFY_API_PREFIX', 'https://api.spotify.com/v1/')
+SPOTIFY_TOKEN_URL = os.getenv('SPOTIFY_TOKEN_URL', SpotifyClientCredentials.OAUTH_TOKEN_URL)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Spotify while the API is considered degraded"""
+
+class TokenBucket:
+    """Global request limiter: rate tokens per second, bursts up to capacity"""
+
+    def __init__(self, rate=10.0, capacity=20):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=2.0):
+        """Take one token, waiting up to timeout seconds for it"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+class CircuitBreaker:
+    """Open after consecutive failures, then let a single trial call through once reset_timeout passes"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.opened_at is not None and (time.monotonic() - self.opened_at) < self.reset_timeout
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if (time.monotonic() - self.opened_at) < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+class SpotifyClient:
+    """Shared Spotify client with process-wide token reuse, Retry-After handling, rate limiting and a circuit breaker"""
+
+    def __init__(self, client_id, client_secret, api_prefix=SPOTIFY_API_PREFIX, token_url=SPOTIFY_TOKEN_URL,
+                 rate=10.0, burst=20, max_retries=2, max_retry_wait=5.0, failure_threshold=5,
+                 reset_timeout=30.0, requests_timeout=5):
+        # Tokens live in memory on this shared manager, so every session reuses them
+        self.auth_manager = SpotifyClientCredentials(
+            client_id=client_id,
+            client_secret=client_secret,
+            cache_handler=MemoryCacheHandler()
+        )
+        self.auth_manager.OAUTH_TOKEN_URL = token_url
+        self.sp = spotipy.Spotify(
+            auth_manager=self.auth_manager,
+            requests_timeout=requests_timeout
+        )
+        # spotipy 2.23 has no constructor argument for the API prefix
+        self.sp.prefix = api_prefix
+        # Replace spotipy's urllib3 retry adapters: they sleep on 429s per call and hide the
+        # Retry-After header, which this class needs to back off globally
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+        self.sp._session.mount('https://', adapter)
+        self.sp._session.mount('http://', adapter)
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def degraded(self):
+        return self.breaker.is_open or time.monotonic() < self.blocked_until
+
+    def _wait_for_retry_after(self):
+        """Honor a Retry-After window shared by all callers, failing fast if it is too long"""
+        with self._lock:
+            wait = self.blocked_until - time.monotonic()
+        if wait <= 0:
+            return
+        if wait > self.max_retry_wait:
+            raise CircuitOpenError(f"Spotify rate limited for another {wait:.1f}s")
+        time.sleep(wait)
+
+    def _block_for(self, seconds):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def call(self, method_name, *args, **kwargs):
+        """Call a spotipy method through the limiter, retry budget and circuit breaker"""
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError("Spotify circuit breaker is open")
+            self._wait_for_retry_after()
+            if not self.bucket.acquire():
+                raise CircuitOpenError("Spotify request rate limit exceeded")
+
+            try:
+                result = getattr(self.sp, method_name)(*args, **kwargs)
+                self.breaker.record_success()
+                return result
+            except spotipy.SpotifyException as e:
+                if e.http_status == 429:
+                    headers = getattr(e, 'headers', None) or {}
+                    retry_after = float(headers.get('Retry-After', headers.get('retry-after', 1)) or 1)
+                    self._block_for(retry_after)
+                    self.breaker.record_failure()
+                    logging.warning(f"Spotify rate limited {method_name}; Retry-After {retry_after}s")
+                elif e.http_status is not None and e.http_status >= 500:
+                    self.breaker.record_failure()
+                    logging.warning(f"Spotify server error on {method_name}: {e.http_status}")
+                    if attempt < self.max_retries:
+                        time.sleep(min(self.max_retry_wait, 0.2 * 2 ** attempt * (1 + random.random())))
+                else:
+                    # Client errors say nothing about API health, so don't count them against the breaker
+                    self.breaker.record_success()
+                    raise
+                if attempt >= self.max_retries:
+                    raise
+            except Exception as e:
+                self.breaker.record_failure()
+                logging.warning(f"Spotify request error on {method_name}: {str(e)}")
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(min(self.max_retry_wait, 0.2 * 2 ** attempt * (1 + random.random())))
+
+    def search(self, *args, **kwargs):
+        return self.call('search', *args, **kwargs)
+
+    def recommendations(self, *args, **kwargs):
+        return self.call('recommendations', *args, **kwargs)
+
+    def audio_features(self, *args, **kwargs):
+        return self.call('audio_features', *args, **kwargs)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_shared_client(client_id, client_secret, api_prefix=SPOTIFY_API_PREFIX, token_url=SPOTIFY_TOKEN_URL):
+    """Return the process-wide client for a set of credentials"""
+    key = (client_id, client_secret, api_prefix, token_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = SpotifyClient(client_id, client_secret, api_prefix=api_prefix, token_url=token_url)
+            _clients[key] = client
+        return client
@@ -1,8 +1,14 @@
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 import os
 import streamlit as st
 import logging
+import re
+import random
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from response_cache import TTLCache
+from playlist_index import get_playlist_index
+from feature_engine import get_feature_engine
+from spotify_client import get_shared_client
 
 # Setup logging
 logging.basicConfig(filename="spotify_errors.log", level=logging.INFO)
@@ -38,6 +44,67 @@ LANGUAGE_KEYWORDS = {
     "english": []
 }
 
+# Shared by every session in the process; set SPOTIFY_CACHE_PATH to keep responses across restarts
+RESPONSE_CACHE_TTL = int(os.getenv('SPOTIFY_CACHE_TTL', 3600))
+_response_cache = TTLCache(
+    ttl=RESPONSE_CACHE_TTL,
+    max_entries=2048,
+    disk_path=os.getenv('SPOTIFY_CACHE_PATH')
+)
+
+def get_response_cache():
+    """Return the process-wide Spotify response cache"""
+    return _response_cache
+
+# Search terms are fanned out concurrently; spotipy reuses pooled connections through its requests session
+_search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="spotify-search")
+
+def _compile_language_patterns():
+    """Compile each language's keywords into one case-insensitive alternation, longest keywords first"""
+    return {
+        language: re.compile(
+            '|'.join(re.escape(keyword) for keyword in sorted(keywords, key=len, reverse=True)),
+            re.IGNORECASE
+        )
+        for language, keywords in LANGUAGE_KEYWORDS.items() if keywords
+    }
+
+LANGUAGE_PATTERNS = _compile_language_patterns()
+# Pools are only narrowed to language matches when at least this many songs survive
+MIN_LANGUAGE_POOL = 20
+
+def _ascii_ratio(text):
+    return len(text.encode('ascii', 'ignore')) / len(text)
+
+def is_language_match(text, language):
+    """Check whether a track or artist name looks like it belongs to the given language"""
+    if not text:
+        return False
+    if language == "english":
+        return _ascii_ratio(text) > 0.5
+    pattern = LANGUAGE_PATTERNS.get(language.lower())
+    return bool(pattern and pattern.search(text))
+
+def match_languages(texts, language):
+    """Batch version of is_language_match: one regex scan over all texts joined together"""
+    if language == "english":
+        return [bool(text) and _ascii_ratio(text) > 0.5 for text in texts]
+    pattern = LANGUAGE_PATTERNS.get(language.lower())
+    matches = [False] * len(texts)
+    if not pattern or not texts:
+        return matches
+
+    # NUL never occurs in a keyword, so no match can span two texts
+    starts = []
+    position = 0
+    for text in texts:
+        starts.append(position)
+        position += len(text or '') + 1
+    joined = '\0'.join(text or '' for text in texts)
+    for match in pattern.finditer(joined):
+        matches[bisect_right(starts, match.start()) - 1] = True
+    return matches
+
 class SpotifyRecommender:
     AVAILABLE_GENRES = {
         'hindi': ['indian', 'bollywood'],
@@ -177,24 +244,134 @@ class SpotifyRecommender:
         self.client_secret = client_secret or os.getenv('SPOTIFY_CLIENT_SECRET') or st.secrets.get("SPOTIFY_CLIENT_SECRET")
         self.sp = self._initialize_spotify()
         self.market = 'IN'
+        self.playlist_index = get_playlist_index()
+        self.feature_engine = get_feature_engine()
 
     def _initialize_spotify(self):
         try:
-            client_credentials_manager = SpotifyClientCredentials(
-                client_id=self.client_id,
-                client_secret=self.client_secret
-            )
-            return spotipy.Spotify(client_credentials_manager=client_credentials_manager)
+            return get_shared_client(self.client_id, self.client_secret)
         except Exception as e:
             logging.error(f"Spotify initialization error: {str(e)}")
             st.error(f"Error initializing Spotify client: {str(e)}")
             return None
 
-    def get_recommendations(self, emotion, language='english', limit=5):
+    @staticmethod
+    def _track_to_song(track):
+        return {
+            'name': track['name'],
+            'artist': track['artists'][0]['name'],
+            'url': track['external_urls']['spotify'],
+            'preview_url': track['preview_url'],
+            'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None
+        }
+
+    @staticmethod
+    def _cached_call(key, fetch):
+        """Serve from the response cache, falling back to an expired entry if the API call fails"""
+        try:
+            return _response_cache.get_or_fetch(key, fetch)
+        except Exception:
+            stale = _response_cache.get_stale(key)
+            if stale is not None:
+                return stale
+            raise
+
+    def _search(self, term, limit, offset=0):
+        """Search tracks through the shared response cache"""
+        key = TTLCache.make_key('search', [term, offset], self.market, limit)
+        return self._cached_call(
+            key,
+            lambda: self.sp.search(q=term, type='track', limit=limit, offset=offset, market=self.market)
+        )
+
+    def _search_term(self, term, limit, offset=0):
+        try:
+            return self._search(term, limit, offset)
+        except Exception as e:
+            logging.warning(f"Search error for term '{term}': {str(e)}")
+            return None
+
+    def _search_many(self, terms, limit, offset=0):
+        """Run searches for all terms concurrently and return the results in term order"""
+        futures = [_search_pool.submit(self._search_term, term, limit, offset) for term in terms]
+        return [future.result() for future in futures]
+
+    def collect_songs(self, terms, pages=2, page_size=50, language=None):
+        """Collect a deduplicated pool of songs over several result pages of each term"""
         if not self.sp:
-            st.error("Spotify client not initialized")
             return []
+        songs = []
+        seen_urls = set()
+        for page in range(pages):
+            offset = page * page_size
+            if offset > MAX_OFFSET:
+                break
+            for results in self._search_many(terms, page_size, offset):
+                if not results:
+                    continue
+                for track in results['tracks']['items']:
+                    song = self._track_to_song(track)
+                    if song['url'] not in seen_urls:
+                        seen_urls.add(song['url'])
+                        songs.append(song)
+        if language:
+            matched = self.filter_songs_by_language(songs, language)
+            if len(matched) >= MIN_LANGUAGE_POOL:
+                return matched
+        return songs
+
+    def start_index_refresh(self, interval=600):
+        """Keep the local playlist index fresh in the background"""
+        self.playlist_index.start_background_refresh(self, SUPPORTED_LANGUAGES, interval)
+
+    def _recommendations(self, recommendation_params):
+        """Fetch recommendations through the shared response cache"""
+        query = {name: value for name, value in recommendation_params.items() if name not in ('market', 'limit')}
+        key = TTLCache.make_key('recommendations', query, self.market, recommendation_params['limit'])
+        return self._cached_call(key, lambda: self.sp.recommendations(**recommendation_params))
+
+    def recommendation_params(self, emotion, language, limit):
+        """Build sp.recommendations arguments from the emotion's seeds and audio-feature targets"""
+        params = self.EMOTION_PARAMS[emotion]
+        audio_features = params['audio_features']
+
+        seed_tracks = []
+        for results in self._search_many(params['search_terms'][language], 2):
+            if results and results['tracks']['items']:
+                track_id = results['tracks']['items'][0]['id']
+                if track_id not in seed_tracks:
+                    seed_tracks.append(track_id)
+                if len(seed_tracks) >= 2:
+                    break
+
+        available_genres = self.AVAILABLE_GENRES[language]
+        seed_genres = [genre for genre in params['seed_genres'][language] if genre in available_genres]
 
+        recommendation_params = {
+            'limit': limit,
+            'market': self.market,
+            'target_valence': audio_features['valence'][2],
+            'target_energy': audio_features['energy'][2],
+            'target_danceability': audio_features['danceability'][2],
+            'min_valence': audio_features['valence'][0],
+            'max_valence': audio_features['valence'][1],
+            'min_energy': audio_features['energy'][0],
+            'max_energy': audio_features['energy'][1],
+            'min_danceability': audio_features['danceability'][0],
+            'max_danceability': audio_features['danceability'][1]
+        }
+
+        if seed_tracks:
+            recommendation_params['seed_tracks'] = seed_tracks[:2]
+            if seed_genres:
+                recommendation_params['seed_genres'] = seed_genres[:3-len(seed_tracks)]
+        elif seed_genres:
+            recommendation_params['seed_genres'] = seed_genres[:5]
+        else:
+            recommendation_params['seed_genres'] = self.EMOTION_PARAMS[emotion]['seed_genres']['english'][:5]
+        return recommendation_params
+
+    def get_recommendations(self, emotion, language='english', limit=5):
         if emotion not in self.EMOTION_PARAMS:
             st.warning(f"Unknown emotion: {emotion}")
             return []
@@ -202,70 +379,31 @@ class SpotifyRecommender:
         language = language.lower()
         emotion = emotion.lower()
 
+        # A built feature catalog ranks tracks by the mood's audio-feature target, so it is tried first
+        local_songs = self.feature_engine.recommend(self.EMOTION_PARAMS[emotion]['audio_features'], language, limit)
+        if local_songs:
+            return local_songs
+
+        # A stale index is still better than a degraded or missing API
+        allow_stale = not self.sp or self.sp.degraded
+        indexed_songs = self.playlist_index.sample(emotion, language, limit, allow_stale=allow_stale)
+        if indexed_songs:
+            return indexed_songs
+
+        if not self.sp:
+            st.error("Spotify client not initialized")
+            return []
+
         try:
             songs = self.search_songs(emotion, language, limit)
             if songs:
                 return songs
 
-            params = self.EMOTION_PARAMS[emotion]
-            audio_features = params['audio_features']
-
-            seed_tracks = []
-            for term in params['search_terms'][language]:
-                try:
-                    results = self.sp.search(
-                        q=term,
-                        type='track',
-                        limit=2,
-                        market=self.market
-                    )
-                    if results['tracks']['items']:
-                        track_id = results['tracks']['items'][0]['id']
-                        if track_id not in seed_tracks:
-                            seed_tracks.append(track_id)
-                        if len(seed_tracks) >= 2:
-                            break
-                except Exception as e:
-                    logging.warning(f"Search error for term '{term}': {str(e)}")
-                    continue
-
-            available_genres = self.AVAILABLE_GENRES[language]
-            seed_genres = [genre for genre in params['seed_genres'][language] if genre in available_genres]
-
-            recommendation_params = {
-                'limit': limit,
-                'market': self.market,
-                'target_valence': audio_features['valence'][2],
-                'target_energy': audio_features['energy'][2],
-                'target_danceability': audio_features['danceability'][2],
-                'min_valence': audio_features['valence'][0],
-                'max_valence': audio_features['valence'][1],
-                'min_energy': audio_features['energy'][0],
-                'max_energy': audio_features['energy'][1],
-                'min_danceability': audio_features['danceability'][0],
-                'max_danceability': audio_features['danceability'][1]
-            }
-
-            if seed_tracks:
-                recommendation_params['seed_tracks'] = seed_tracks[:2]
-                if seed_genres:
-                    recommendation_params['seed_genres'] = seed_genres[:3-len(seed_tracks)]
-            elif seed_genres:
-                recommendation_params['seed_genres'] = seed_genres[:5]
-            else:
-                recommendation_params['seed_genres'] = self.EMOTION_PARAMS[emotion]['seed_genres']['english'][:5]
+            recommendation_params = self.recommendation_params(emotion, language, limit)
 
             try:
-                recommendations = self.sp.recommendations(**recommendation_params)
-                songs = []
-                for track in recommendations['tracks']:
-                    songs.append({
-                        'name': track['name'],
-                        'artist': track['artists'][0]['name'],
-                        'url': track['external_urls']['spotify'],
-                        'preview_url': track['preview_url'],
-                        'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None
-                    })
+                recommendations = self._recommendations(recommendation_params)
+                songs = [self._track_to_song(track) for track in recommendations['tracks']]
                 if songs:
                     return songs
             except Exception as e:
@@ -277,34 +415,93 @@ class SpotifyRecommender:
             st.error(f"Error getting recommendations: {str(e)}")
             return []
 
+    @staticmethod
+    def _allocate_slots(weights, total):
+        """Split total slots proportionally to weights using the largest-remainder method"""
+        weight_sum = sum(weights.values())
+        quotas = {key: total * weight / weight_sum for key, weight in weights.items()}
+        slots = {key: int(quota) for key, quota in quotas.items()}
+        remaining = total - sum(slots.values())
+        for key in sorted(quotas, key=lambda key: quotas[key] - slots[key], reverse=True)[:remaining]:
+            slots[key] += 1
+        return slots
+
+    def get_blended_recommendations(self, emotion_weights, languages=('english',), limit=10):
+        """Build one playlist for a weighted mix of emotions across languages with the fewest API calls"""
+        languages = [language.lower() for language in languages if language.lower() in SUPPORTED_LANGUAGES]
+        weights = {}
+        for emotion, weight in emotion_weights.items():
+            emotion = emotion.lower()
+            if emotion in self.EMOTION_PARAMS and weight > 0:
+                for language in languages:
+                    weights[(emotion, language)] = weights.get((emotion, language), 0) + weight / len(languages)
+        if not weights:
+            return []
+
+        # Pairs the local index can serve need no network; the rest share one deduplicated fan-out
+        # As in get_recommendations, a stale index beats a degraded or missing API
+        allow_stale = not self.sp or self.sp.degraded
+        pools = {}
+        for emotion, language in weights:
+            pool = self.playlist_index.pool(emotion, language, allow_stale=allow_stale)
+            if pool:
+                pools[(emotion, language)] = pool
+
+        missing = [pair for pair in weights if pair not in pools]
+        if missing and self.sp:
+            terms = list(dict.fromkeys(
+                term for emotion, language in missing
+                for term in self.EMOTION_PARAMS[emotion]['search_terms'][language]
+            ))
+            songs_by_term = {}
+            for term, results in zip(terms, self._search_many(terms, max(limit, 10))):
+                if results:
+                    songs_by_term[term] = [self._track_to_song(track) for track in results['tracks']['items']]
+            for emotion, language in missing:
+                pools[(emotion, language)] = [
+                    song for term in self.EMOTION_PARAMS[emotion]['search_terms'][language]
+                    for song in songs_by_term.get(term, [])
+                ]
+
+        weights = {pair: weight for pair, weight in weights.items() if pools.get(pair)}
+        if not weights:
+            return []
+
+        slots = self._allocate_slots(weights, limit)
+        seen_urls = set()
+        picks = {}
+        for pair in sorted(weights, key=weights.get, reverse=True):
+            candidates = [song for song in pools[pair] if song['url'] not in seen_urls]
+            chosen = random.sample(candidates, min(slots[pair], len(candidates)))
+            seen_urls.update(song['url'] for song in chosen)
+            picks[pair] = [dict(song, emotion=pair[0], language=pair[1]) for song in chosen]
+
+        # Hand slots a pair could not fill to the other pairs, heaviest first
+        shortfall = limit - sum(len(songs) for songs in picks.values())
+        for pair in sorted(weights, key=weights.get, reverse=True):
+            if shortfall <= 0:
+                break
+            extra = [song for song in pools[pair] if song['url'] not in seen_urls][:shortfall]
+            seen_urls.update(song['url'] for song in extra)
+            picks[pair].extend(dict(song, emotion=pair[0], language=pair[1]) for song in extra)
+            shortfall -= len(extra)
+
+        # Interleave so the playlist mixes moods instead of playing them in blocks
+        playlist = []
+        ordered = sorted(picks.values(), key=len, reverse=True)
+        for i in range(max((len(songs) for songs in ordered), default=0)):
+            playlist.extend(songs[i] for songs in ordered if i < len(songs))
+        return playlist
+
     def search_songs(self, emotion, language='english', limit=5):
         if not self.sp:
             return []
 
         try:
             search_terms = self.EMOTION_PARAMS[emotion]['search_terms'][language]
-            for term in search_terms:
-                try:
-                    results = self.sp.search(
-                        q=term,
-                        limit=limit,
-                        type='track',
-                        market=self.market
-                    )
-                    if results['tracks']['items']:
-                        songs = []
-                        for track in results['tracks']['items']:
-                            songs.append({
-                                'name': track['name'],
-                                'artist': track['artists'][0]['name'],
-                                'url': track['external_urls']['spotify'],
-                                'preview_url': track['preview_url'],
-                                'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None
-                            })
-                        return songs
-                except Exception as e:
-                    logging.warning(f"Search error for term '{term}': {str(e)}")
-                    continue
+            for results in self._search_many(search_terms, limit):
+                if results and results['tracks']['items']:
+                    return [self._track_to_song(track) for track in results['tracks']['items']]
             return []
         except Exception as e:
             logging.error(f"Error searching songs: {str(e)}")
@@ -312,12 +509,9 @@ class SpotifyRecommender:
             return []
 
     def _is_language_match(self, text, language):
-        if not text:
-            return False
-        text_lower = text.lower()
-        if language == "english":
-            ascii_ratio = sum(1 for char in text if ord(char) < 128) / len(text)
-            return ascii_ratio > 0.5
-        else:
-            keywords = LANGUAGE_KEYWORDS.get(language.lower(), [])
-            return any(keyword.lower() in text_lower for keyword in keywords)
+        return is_language_match(text, language)
+
+    def filter_songs_by_language(self, songs, language):
+        """Keep the songs whose name or artist matches the language"""
+        flags = match_languages([f"{song['name']} {song['artist']}" for song in songs], language)
+        return [song for song, flag in zip(songs, flags) if flag]
@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+
+import pytest
+import spotipy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_spotify_server import MockSpotifyServer
+from spotify_client import CircuitOpenError, SpotifyClient, get_shared_client
+
+@pytest.fixture
+def mock_server():
+    with MockSpotifyServer() as server:
+        yield server
+
+def make_client(server, **kwargs):
+    return SpotifyClient('client-id', 'client-secret', api_prefix=server.api_prefix,
+                         token_url=server.token_url, **kwargs)
+
+def test_search_goes_to_configured_prefix(mock_server):
+    client = make_client(mock_server)
+    result = client.search(q='happy', type='track', limit=3)
+    assert len(result['tracks']['items']) == 3
+    assert mock_server.request_count == 1
+
+def test_recommendations(mock_server):
+    client = make_client(mock_server)
+    result = client.recommendations(seed_genres=['pop'], limit=4)
+    assert len(result['tracks']) == 4
+
+def test_audio_features(mock_server):
+    client = make_client(mock_server)
+    features = client.audio_features(['abc', 'def'])
+    assert [track['id'] for track in features] == ['abc', 'def']
+    assert all(0 <= track['valence'] <= 1 for track in features)
+
+def test_rate_limit_waits_for_retry_after(mock_server):
+    client = make_client(mock_server)
+    mock_server.throttle(1, retry_after=0.3)
+
+    start = time.monotonic()
+    result = client.search(q='sad', type='track', limit=2)
+
+    assert time.monotonic() - start >= 0.3
+    assert len(result['tracks']['items']) == 2
+    assert mock_server.request_count == 2
+
+def test_rate_limit_longer_than_budget_fails_fast(mock_server):
+    client = make_client(mock_server, max_retries=1, max_retry_wait=0.5)
+    mock_server.throttle(1, retry_after=30)
+
+    start = time.monotonic()
+    with pytest.raises(CircuitOpenError):
+        client.search(q='sad', type='track', limit=2)
+
+    assert time.monotonic() - start < 1
+    assert client.degraded
+
+def test_circuit_breaker_opens_and_recovers(mock_server):
+    client = make_client(mock_server, max_retries=0, failure_threshold=2, reset_timeout=0.3)
+    mock_server.fail(2)
+
+    for _ in range(2):
+        with pytest.raises(spotipy.SpotifyException):
+            client.search(q='angry', type='track', limit=1)
+    assert client.degraded
+
+    requests_before = mock_server.request_count
+    with pytest.raises(CircuitOpenError):
+        client.search(q='angry', type='track', limit=1)
+    assert mock_server.request_count == requests_before
+
+    time.sleep(0.35)
+    assert client.search(q='angry', type='track', limit=1)['tracks']['items']
+    assert not client.degraded
+
+def test_access_token_is_reused(mock_server):
+    client = make_client(mock_server)
+    for _ in range(3):
+        client.search(q='neutral', type='track', limit=1)
+    client.recommendations(seed_genres=['pop'], limit=1)
+
+    assert mock_server.token_requests == 1
+
+def test_shared_client_is_reused_per_credentials(mock_server):
+    first = get_shared_client('id', 'secret', mock_server.api_prefix, mock_server.token_url)
+    second = get_shared_client('id', 'secret', mock_server.api_prefix, mock_server.token_url)
+    assert first is second
@@ -0,0 +1,156 @@
+import os
+import time
+import logging
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from video_sampler import FrameSampler
+
+# Setup logging
+logging.basicConfig(filename="emotion_errors.log", level=logging.INFO)
+
+_worker_detector = None
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _init_worker(detector_backend, max_batch_size, face_detector_backend=None, emotion_backend=None):
+    """Load the models once in each worker process"""
+    global _worker_detector
+    from emotion_detector import EmotionDetector
+
+    _worker_detector = EmotionDetector(detector_backend=detector_backend, max_batch_size=max_batch_size,
+                                       face_detector_backend=face_detector_backend, emotion_backend=emotion_backend)
+    _worker_detector.registry.get_face_detector(_worker_detector.face_detector_backend)
+    _worker_detector.registry.get_emotion_model(_worker_detector.emotion_backend)
+
+def _ping():
+    time.sleep(0.05)
+    return os.getpid()
+
+def _analyze_indices(video_path, indices):
+    """Analyze the given frame indices of a video inside a worker process"""
+    sampler = FrameSampler(video_path, indices=indices)
+    results = []
+    try:
+        for frame_index, timestamp, frame in sampler:
+            face_records, _ = _worker_detector.analyze_frame(frame, return_rgb=False)
+            results.append((frame_index, timestamp, face_records))
+    except Exception as e:
+        logging.error(f"Segment analysis error in {video_path}: {str(e)}")
+    finally:
+        sampler.release()
+    return results
+
+def get_process_pool(workers, detector_backend='skip', max_batch_size=32, face_detector_backend=None,
+                     emotion_backend=None):
+    """Return a persistent worker pool whose processes keep their models loaded between videos"""
+    key = (workers, detector_backend, max_batch_size, face_detector_backend, emotion_backend)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            # spawn rather than fork so workers never inherit TensorFlow state from the parent
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(detector_backend, max_batch_size, face_detector_backend, emotion_backend)
+            )
+            _pools[key] = pool
+        return pool
+
+def warm_up_pool(pool, workers):
+    """Start every worker process so model loading is not counted against the first video"""
+    list(pool.map(_ping, range(workers * 2)))
+
+def split_segments(indices, workers):
+    """Split sorted frame indices into contiguous time ranges, one per worker"""
+    indices = list(indices)
+    if not indices:
+        return []
+    size = -(-len(indices) // workers)
+    return [indices[start:start + size] for start in range(0, len(indices), size)]
+
+def analyze_video_segments(video_path, indices, workers, detector_backend='skip', max_batch_size=32,
+                           face_detector_backend=None, emotion_backend=None):
+    """Yield (frame_index, timestamp, face_records) in frame order, analyzing segments in parallel"""
+    pool = get_process_pool(workers, detector_backend, max_batch_size, face_detector_backend, emotion_backend)
+    futures = [pool.submit(_analyze_indices, video_path, segment) for segment in split_segments(indices, workers)]
+    try:
+        for future in futures:
+            for frame_result in sorted(future.result(), key=lambda item: item[0]):
+                yield frame_result
+    finally:
+        for future in futures:
+            future.cancel()
+
+def benchmark_workers(video_path, max_workers=None, sampling='fps', target_fps=10, num_frames=None,
+                      max_frames=None):
+    """Time segment-parallel analysis of a video with 1..max_workers processes"""
+    max_workers = max_workers or os.cpu_count() or 1
+    sampler = FrameSampler(video_path, strategy=sampling, target_fps=target_fps,
+                           num_frames=num_frames, max_frames=max_frames)
+    if not sampler.open():
+        raise ValueError(f"Could not open video file: {video_path}")
+    if sampler.frame_limit is None:
+        sampler.release()
+        raise ValueError("Video length is unknown; pass max_frames to bound the benchmark")
+    indices = list(sampler.target_indices())
+    sampler.release()
+
+    rows = []
+    baseline = None
+    for workers in range(1, max_workers + 1):
+        pool = get_process_pool(workers)
+        try:
+            warm_up_pool(pool, workers)
+            start = time.perf_counter()
+            frames = sum(1 for _ in analyze_video_segments(video_path, indices, workers))
+            elapsed = time.perf_counter() - start
+        finally:
+            # Only one pool's processes and models should be alive while each row is timed
+            shutdown_pool(pool)
+        baseline = baseline or elapsed
+        rows.append({
+            'workers': workers,
+            'frames': frames,
+            'seconds': elapsed,
+            'frames_per_second': frames / elapsed if elapsed else 0.0,
+            'speedup': baseline / elapsed if elapsed else 0.0
+        })
+    return rows
+
+def shutdown_pool(pool):
+    """Stop one pool and forget it so a later get_process_pool starts a fresh one"""
+    with _pools_lock:
+        for key, cached_pool in list(_pools.items()):
+            if cached_pool is pool:
+                del _pools[key]
+    pool.shutdown(cancel_futures=True)
+
+def shutdown_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(cancel_futures=True)
+        _pools.clear()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark segment-parallel video emotion analysis")
+    parser.add_argument('video_path')
+    parser.add_argument('--max-workers', type=int, default=None)
+    parser.add_argument('--sampling', choices=['fps', 'count'], default='fps')
+    parser.add_argument('--target-fps', type=float, default=10)
+    parser.add_argument('--num-frames', type=int, default=None)
+    parser.add_argument('--max-frames', type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        results = benchmark_workers(args.video_path, args.max_workers, args.sampling,
+                                    args.target_fps, args.num_frames, args.max_frames)
+        print(f"{'workers':>7} {'frames':>7} {'seconds':>9} {'frames/s':>9} {'speedup':>8}")
+        for row in results:
+            print(f"{row['workers']:>7} {row['frames']:>7} {row['seconds']:>9.2f} "
+                  f"{row['frames_per_second']:>9.1f} {row['speedup']:>7.2f}x")
+    finally:
+        shutdown_pools()
@@ -0,0 +1,164 @@
+import os
+import queue
+import threading
+import logging
+
+# Setup logging
+logging.basicConfig(filename="emotion_errors.log", level=logging.INFO)
+
+_SENTINEL = object()
+
+class VideoPipeline:
+    """Overlap frame decoding, face detection and batched emotion classification on worker threads.
+
+    With a FaceTracker, detections are put back in frame order before classification so the
+    tracker sees frames sequentially and only new, stale or changed faces are classified.
+    """
+
+    def __init__(self, detector, detection_workers=None, queue_size=8, max_batch_frames=4, tracker=None):
+        self.detector = detector
+        self.tracker = tracker
+        self.detection_workers = detection_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.queue_size = queue_size
+        self.max_batch_frames = max_batch_frames
+        self._stop = threading.Event()
+
+    def _put(self, q, item):
+        """Put into a bounded queue, giving up if the pipeline is being stopped"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        """Get from a queue, returning the sentinel if the pipeline is being stopped"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _SENTINEL
+
+    def _decode(self, sampler, frame_queue):
+        try:
+            for seq, (frame_index, timestamp, frame) in enumerate(sampler):
+                if not self._put(frame_queue, (seq, frame_index, timestamp, frame)):
+                    return
+        except Exception as e:
+            logging.error(f"Video decode error: {str(e)}")
+        finally:
+            for _ in range(self.detection_workers):
+                self._put(frame_queue, _SENTINEL)
+
+    def _detect(self, frame_queue, detect_queue):
+        registry = self.detector.registry
+        try:
+            # Each detection thread gets its own detector instance; they are not safe to share
+            with registry.lease_face_detector(self.detector.face_detector_backend) as face_detector:
+                while True:
+                    item = self._get(frame_queue)
+                    if item is _SENTINEL:
+                        break
+                    seq, frame_index, timestamp, frame = item
+                    try:
+                        face_imgs, boxes = self.detector.extract_faces(frame, face_detector)
+                    except Exception as e:
+                        logging.error(f"Pipeline detection error: {str(e)}")
+                        face_imgs, boxes = [], []
+                    if not self._put(detect_queue, (seq, frame_index, timestamp, face_imgs, boxes)):
+                        return
+        except Exception as e:
+            logging.error(f"Pipeline detector load error: {str(e)}")
+        finally:
+            self._put(detect_queue, _SENTINEL)
+
+    def _classify_batch(self, batch):
+        """Face records for each (seq, frame_index, timestamp, face_imgs, boxes) item of a batch"""
+        if self.tracker is not None:
+            return self.detector.classify_tracked(
+                [(face_imgs, boxes, timestamp) for _, _, timestamp, face_imgs, boxes in batch], self.tracker
+            )
+        all_faces = [face_img for _, _, _, face_imgs, _ in batch for face_img in face_imgs]
+        results = self.detector.analyze_emotions(all_faces)
+        records = []
+        offset = 0
+        for _, _, _, face_imgs, boxes in batch:
+            records.append(self.detector.build_face_records(face_imgs, boxes, results[offset:offset + len(face_imgs)]))
+            offset += len(face_imgs)
+        return records
+
+    def _classify(self, detect_queue, result_queue):
+        finished_workers = 0
+        pending = {}
+        next_seq = 0
+        try:
+            while finished_workers < self.detection_workers and not self._stop.is_set():
+                batch = []
+                item = self._get(detect_queue)
+                while True:
+                    if item is _SENTINEL:
+                        finished_workers += 1
+                    else:
+                        batch.append(item)
+                    if len(batch) >= self.max_batch_frames or finished_workers >= self.detection_workers:
+                        break
+                    try:
+                        item = detect_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if self.tracker is not None:
+                    # Detection workers finish out of order; the tracker must see frames in sequence
+                    pending.update((item[0], item) for item in batch)
+                    batch = []
+                    while next_seq in pending:
+                        batch.append(pending.pop(next_seq))
+                        next_seq += 1
+                if not batch:
+                    continue
+
+                for (seq, frame_index, timestamp, _, _), face_records in zip(batch, self._classify_batch(batch)):
+                    if not self._put(result_queue, (seq, frame_index, timestamp, face_records)):
+                        return
+        except Exception as e:
+            logging.error(f"Pipeline classification error: {str(e)}")
+        finally:
+            self._put(result_queue, _SENTINEL)
+
+    def run(self, sampler):
+        """Yield (frame_index, timestamp, face_records) for each sampled frame, in frame order"""
+        self._stop.clear()
+        frame_queue = queue.Queue(maxsize=self.queue_size)
+        detect_queue = queue.Queue(maxsize=self.queue_size)
+        result_queue = queue.Queue(maxsize=self.queue_size)
+
+        threads = [threading.Thread(target=self._decode, args=(sampler, frame_queue), daemon=True)]
+        threads += [
+            threading.Thread(target=self._detect, args=(frame_queue, detect_queue), daemon=True)
+            for _ in range(self.detection_workers)
+        ]
+        threads.append(threading.Thread(target=self._classify, args=(detect_queue, result_queue), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        pending = {}
+        next_seq = 0
+        try:
+            while True:
+                item = result_queue.get()
+                if item is _SENTINEL:
+                    break
+                pending[item[0]] = item
+                while next_seq in pending:
+                    _, frame_index, timestamp, face_records = pending.pop(next_seq)
+                    next_seq += 1
+                    yield frame_index, timestamp, face_records
+            for seq in sorted(pending):
+                _, frame_index, timestamp, face_records = pending[seq]
+                yield frame_index, timestamp, face_records
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join(timeout=1.0)
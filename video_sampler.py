@@ -0,0 +1,120 @@
+import cv2
+import itertools
+import logging
+
+# Setup logging
+logging.basicConfig(filename="emotion_errors.log", level=logging.INFO)
+
+# Gaps larger than this are cheaper to seek over than to grab frame by frame
+SEEK_THRESHOLD = 30
+SAMPLING_STRATEGIES = ['fps', 'count', 'keyframes']
+
+class FrameSampler:
+    """Yield only the frames of a video that will be analyzed, without decoding the rest"""
+
+    def __init__(self, video_path, strategy='fps', target_fps=10, num_frames=None,
+                 max_frames=None, frame_skip=5, indices=None):
+        if strategy not in SAMPLING_STRATEGIES:
+            raise ValueError(f"Unknown sampling strategy: {strategy}")
+        if strategy == 'count' and indices is None and not num_frames:
+            raise ValueError("The count sampling strategy needs num_frames")
+        self.video_path = video_path
+        self.strategy = strategy
+        self.target_fps = target_fps
+        self.num_frames = num_frames
+        self.max_frames = max_frames
+        self.frame_skip = frame_skip
+        # Explicit frame indices override the strategy (used for per-segment workers)
+        self.indices = indices
+        self.cap = None
+        self.fps = 0
+        self.total_frames = 0
+
+    def open(self):
+        """Open the video and read its frame rate and length"""
+        self.cap = cv2.VideoCapture(self.video_path)
+        if not self.cap.isOpened():
+            logging.error(f"Could not open video file: {self.video_path}")
+            return False
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 0
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        return True
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    @property
+    def frame_limit(self):
+        """Index one past the last frame that may be sampled"""
+        limits = [limit for limit in (self.max_frames, self.total_frames) if limit]
+        return min(limits) if limits else None
+
+    def target_indices(self):
+        """Frame indices to analyze for the fps and count strategies"""
+        if self.indices is not None:
+            return self.indices
+        limit = self.frame_limit
+        if self.strategy == 'count':
+            if not limit:
+                raise ValueError("Video length is unknown; pass max_frames to use the count sampling strategy")
+            count = min(self.num_frames, limit)
+            return sorted({int(i * limit / count) for i in range(count)})
+
+        step = max(1, int(self.fps / self.target_fps)) if self.fps > 0 else self.frame_skip
+        # Keep the original 1-based "every step-th frame" alignment
+        if limit is None:
+            return itertools.count(step - 1, step)
+        return range(step - 1, limit, step)
+
+    def __iter__(self):
+        if self.strategy == 'keyframes' and self.indices is None:
+            yield from self._iter_keyframes()
+            return
+
+        if self.cap is None and not self.open():
+            return
+        yield from self._iter_indices(self.target_indices())
+
+    def _iter_indices(self, indices):
+        """Grab past skipped frames, or seek over long gaps, and decode only the targets"""
+        position = 0
+        for target in indices:
+            gap = target - position
+            if gap > SEEK_THRESHOLD or gap < 0:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            else:
+                for _ in range(gap):
+                    if not self.cap.grab():
+                        return
+            ret, frame = self.cap.read()
+            if not ret:
+                return
+            position = target + 1
+            timestamp = target / self.fps if self.fps > 0 else 0.0
+            yield target, timestamp, frame
+
+    def _iter_keyframes(self):
+        """Decode keyframes only, using PyAV to skip non-key frames inside the codec"""
+        import av
+
+        try:
+            container = av.open(self.video_path)
+        except Exception as e:
+            logging.error(f"Could not open video file: {self.video_path} ({str(e)})")
+            return
+        try:
+            stream = container.streams.video[0]
+            stream.codec_context.skip_frame = "NONKEY"
+            self.fps = float(stream.average_rate or 0)
+            self.total_frames = stream.frames
+            limit = self.frame_limit
+            for frame in container.decode(stream):
+                timestamp = float(frame.time or 0.0)
+                index = int(round(timestamp * self.fps)) if self.fps > 0 else frame.index
+                if limit is not None and index >= limit:
+                    break
+                yield index, timestamp, frame.to_ndarray(format='bgr24')
+        finally:
+            container.close()